@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+"""Rendering of HTML tables for Confluence pages"""
+
+__author__ = 'Michael Meisinger'
+
+import cgi
+
+HTABLE_START = """
+<div class="panel" style="border-width: 1px;">
+  <div class="panelContent">
+    <h3>%%TITLE%%</h3>
+    <div class='table-wrap'>
+      <table class='confluenceTable'>"""
+
+HTABLE_END = """
+      </table>
+    </div>
+  </div>
+</div>"""
+
+HTABLE_ROW_START = """
+        <tr>"""
+
+HTABLE_ROW_END = """
+        </tr>"""
+
+HTABLE_HEAD_ROW = """
+          <th class='confluenceTh'>%%TEXT%%</th>"""
+
+HTABLE_ROW = """
+          <td class='confluenceTd'>%%TEXT%%</td>"""
+
+HTABLE_SEP = """
+<p>
+  <br class="atl-forced-newline" />
+</p>"""
+
+
+def _compile(template, placeholder):
+    """Splits a template into the text before and after its placeholder"""
+    before, after = template.split(placeholder)
+    return before, after
+
+_START_BEFORE, _START_AFTER = _compile(HTABLE_START, "%%TITLE%%")
+_HEAD_BEFORE, _HEAD_AFTER = _compile(HTABLE_HEAD_ROW, "%%TEXT%%")
+_CELL_BEFORE, _CELL_AFTER = _compile(HTABLE_ROW, "%%TEXT%%")
+
+# The cells of a row are joined with the end of one cell and the start of the next
+_HEAD_SEP = _HEAD_AFTER + _HEAD_BEFORE
+_CELL_SEP = _CELL_AFTER + _CELL_BEFORE
+_HEAD_ROW_START = HTABLE_ROW_START + _HEAD_BEFORE
+_CELL_ROW_START = HTABLE_ROW_START + _CELL_BEFORE
+_HEAD_ROW_END = _HEAD_AFTER + HTABLE_ROW_END
+_CELL_ROW_END = _CELL_AFTER + HTABLE_ROW_END
+
+
+def escape(value):
+    """Returns value as HTML escaped utf-8 str"""
+    if isinstance(value, unicode):
+        value = value.encode("utf-8")
+    elif not isinstance(value, str):
+        value = str(value)
+    return cgi.escape(value)
+
+
+def render_table(title, header, rows):
+    """Returns the HTML of a table panel titled title, with the given header cells and
+    rows of cells. All values are escaped."""
+    parts = [_START_BEFORE, escape(title), _START_AFTER,
+             _HEAD_ROW_START, _HEAD_SEP.join(map(escape, header)), _HEAD_ROW_END]
+    for row in rows:
+        parts.append(_CELL_ROW_START)
+        parts.append(_CELL_SEP.join(map(escape, row)))
+        parts.append(_CELL_ROW_END)
+    parts.append(HTABLE_END)
+    return "".join(parts)
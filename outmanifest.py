@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+"""Manifest of generated output files with their content hashes"""
+
+__author__ = 'Michael Meisinger'
+
+import datetime
+import hashlib
+import json
+import os
+
+
+def get_content_hash(content):
+    return hashlib.sha1(content).hexdigest()
+
+
+def get_file_hash(filename):
+    """Returns the content hash of a file, or None if it does not exist"""
+    if not os.path.exists(filename):
+        return None
+    sha = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), ""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def write_if_changed(filename, content, prev_hash=None):
+    """Writes content to filename unless the file already has this content, as known
+    from prev_hash or else the file itself. Returns (content hash, True if written)"""
+    content_hash = get_content_hash(content)
+    if prev_hash is None or not os.path.exists(filename):
+        prev_hash = get_file_hash(filename)
+    if content_hash == prev_hash:
+        return content_hash, False
+    with open(filename, "wb") as f:
+        f.write(content)
+    return content_hash, True
+
+
+class OutputManifest(object):
+    """Records the content hash of each file generated by a tool, in a JSON file.
+
+    Files whose content did not change are not rewritten. After a run, the manifest
+    lists the files that were changed and removed in this run, e.g. for a sync job
+    to upload."""
+
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.files = json.load(f).get("files", {})
+        self.changed = []
+        self.removed = []
+        self._seen = set()
+
+    def get_hash(self, filename):
+        return self.files.get(filename)
+
+    def update(self, filename, content_hash, changed):
+        self.files[filename] = content_hash
+        self._seen.add(filename)
+        if changed:
+            self.changed.append(filename)
+
+    def commit_file(self, tmp_filename, filename):
+        """Moves a file written to tmp_filename to filename, unless filename already has
+        the same content. Returns True if moved"""
+        content_hash = get_file_hash(tmp_filename)
+        changed = content_hash != get_file_hash(filename)
+        if changed:
+            os.rename(tmp_filename, filename)
+        else:
+            os.remove(tmp_filename)
+        self.update(filename, content_hash, changed)
+        return changed
+
+    def remove_stale(self, out_dir):
+        """Removes the files in out_dir from a previous run that were not generated
+        in this run"""
+        prefix = os.path.join(out_dir, "")
+        for filename in sorted(self.files):
+            if filename.startswith(prefix) and filename not in self._seen:
+                if os.path.exists(filename):
+                    os.remove(filename)
+                del self.files[filename]
+                self.removed.append(filename)
+
+    def save(self):
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        with open(self.path, "w") as f:
+            json.dump(dict(files=self.files, changed=sorted(self.changed), removed=self.removed,
+                           updated_at=datetime.datetime.now().isoformat()),
+                      f, indent=2, sort_keys=True)
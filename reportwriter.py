@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+
+"""Writers for report workbooks"""
+
+__author__ = 'Michael Meisinger'
+
+import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from xml.sax.saxutils import escape, quoteattr
+
+try:
+    import xlwt
+except ImportError:
+    xlwt = None
+
+# Number of rows buffered per sheet before they are written out
+XLSX_BUFFER_ROWS = 1000
+
+# Fixed time of all parts of an xlsx file, so that the same content gives the same file
+XLSX_PART_DATE = (1980, 1, 1, 0, 0, 0)
+XLSX_PART_MTIME = time.mktime(XLSX_PART_DATE + (0, 0, -1))
+
+# Characters not allowed in XML 1.0
+_invalid_xml_sub = re.compile(u"[\x00-\x08\x0b\x0c\x0e-\x1f]").sub
+# Matches str values that are not plain ASCII text without XML markup characters
+_not_plain_search = re.compile("[^\t\n\r\x20-\x25\x27-\x3b\x3d\x3f-\x7e]").search
+
+XLSX_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+%s
+</Types>"""
+
+XLSX_CONTENT_TYPE_SHEET = """<Override PartName="/xl/worksheets/sheet%s.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>"""
+
+XLSX_ROOT_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+
+XLSX_WORKBOOK = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets>
+%s
+</sheets>
+</workbook>"""
+
+XLSX_WORKBOOK_SHEET = """<sheet name=%s sheetId="%s" r:id="rId%s"/>"""
+
+XLSX_WORKBOOK_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+%s
+<Relationship Id="rIdStyles" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>"""
+
+XLSX_WORKBOOK_REL_SHEET = """<Relationship Id="rId%s" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet%s.xml"/>"""
+
+XLSX_STYLES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>
+<fills count="1"><fill><patternFill patternType="none"/></fill></fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>
+</styleSheet>"""
+
+XLSX_SHEET_START = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>"""
+
+XLSX_SHEET_END = """</sheetData></worksheet>"""
+
+
+class XmlText(str):
+    """utf-8 text already escaped for an xlsx cell, written by XlsxSheet as is"""
+    __slots__ = ()
+
+
+def xlsx_cell_text(value):
+    """Returns unicode or str (utf-8) text as XmlText. Text written to many cells, e.g.
+    requirement statements, is converted once with this and the result reused."""
+    if isinstance(value, str):
+        value = value.decode("utf-8", "replace")
+    elif not isinstance(value, unicode):
+        value = unicode(value)
+    return XmlText(escape(_invalid_xml_sub(u"", value)).encode("utf-8"))
+
+
+def get_report_writer(filename):
+    """Returns a writer for the given file: the legacy xlwt writer for .xls files,
+    otherwise the streaming xlsx writer"""
+    if filename.lower().endswith(".xls"):
+        return XlwtReportWriter(filename)
+    return XlsxReportWriter(filename)
+
+
+class XlwtReportWriter(object):
+    """Writes an .xls workbook using xlwt. The workbook is held in memory until close.
+    xls sheets are limited to 65536 rows."""
+
+    # Text is passed to xlwt as unicode
+    text_encoder = None
+
+    def __init__(self, filename):
+        if xlwt is None:
+            raise ImportError("xlwt is required to write .xls file %s" % filename)
+        self.filename = filename
+        self._wb = xlwt.Workbook()
+
+    def add_sheet(self, name, header):
+        sheet = XlwtSheet(self._wb.add_sheet(name))
+        sheet.append(header)
+        return sheet
+
+    def close(self):
+        self._wb.save(self.filename)
+
+    def abort(self):
+        """Discards the workbook; nothing is written before close"""
+        self._wb = None
+
+
+class XlwtSheet(object):
+    def __init__(self, ws):
+        self._ws = ws
+        self._row = 0
+
+    def append(self, values):
+        ws, row = self._ws, self._row
+        for col, value in enumerate(values):
+            ws.write(row, col, value)
+        self._row += 1
+
+
+class XlsxReportWriter(object):
+    """Writes an .xlsx workbook, streaming the rows of each sheet into a temporary
+    file as they are appended. Only up to XLSX_BUFFER_ROWS rows per sheet are held
+    in memory. Sheets can be appended to in any interleaving. The workbook file is
+    assembled on close."""
+
+    # Converts text to the XmlText written into cells, for callers caching cell text
+    text_encoder = staticmethod(xlsx_cell_text)
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._tmp_dir = tempfile.mkdtemp(prefix="reportwriter")
+        self._sheets = []
+
+    def add_sheet(self, name, header):
+        sheet = XlsxSheet(os.path.join(self._tmp_dir, "sheet%s.xml" % (len(self._sheets) + 1)))
+        self._sheets.append((name, sheet))
+        sheet.append(header)
+        return sheet
+
+    def close(self):
+        try:
+            sheet_nums = range(1, len(self._sheets) + 1)
+            with zipfile.ZipFile(self.filename, "w", zipfile.ZIP_DEFLATED) as zf:
+                self._write_part(zf, "[Content_Types].xml", XLSX_CONTENT_TYPES % "\n".join(XLSX_CONTENT_TYPE_SHEET % num for num in sheet_nums))
+                self._write_part(zf, "_rels/.rels", XLSX_ROOT_RELS)
+                self._write_part(zf, "xl/workbook.xml", XLSX_WORKBOOK % "\n".join(
+                    XLSX_WORKBOOK_SHEET % (quoteattr(name[:31]).encode("utf-8"), num, num)
+                    for num, (name, sheet) in zip(sheet_nums, self._sheets)))
+                self._write_part(zf, "xl/_rels/workbook.xml.rels", XLSX_WORKBOOK_RELS % "\n".join(XLSX_WORKBOOK_REL_SHEET % (num, num) for num in sheet_nums))
+                self._write_part(zf, "xl/styles.xml", XLSX_STYLES)
+                for num, (name, sheet) in zip(sheet_nums, self._sheets):
+                    sheet.close()
+                    # Sheet parts are copied from their files, with the file's time and mode
+                    os.utime(sheet.path, (XLSX_PART_MTIME, XLSX_PART_MTIME))
+                    os.chmod(sheet.path, 0644)
+                    zf.write(sheet.path, "xl/worksheets/sheet%s.xml" % num)
+        finally:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+    def abort(self):
+        """Discards the workbook without writing it, e.g. after an error while adding rows"""
+        for name, sheet in self._sheets:
+            sheet.abort()
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+    def _write_part(self, zf, name, content):
+        zinfo = zipfile.ZipInfo(name, XLSX_PART_DATE)
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        zinfo.external_attr = 0100644 << 16
+        zf.writestr(zinfo, content)
+
+
+class XlsxSheet(object):
+    def __init__(self, path):
+        self.path = path
+        self._f = open(path, "wb")
+        self._f.write(XLSX_SHEET_START)
+        self._buffer = []
+        self._row = 0
+        self._col_names = []
+
+    def append(self, values):
+        self._row += 1
+        row_num = str(self._row)
+        if len(values) > len(self._col_names):
+            self._col_names.extend(_get_col_name(col) for col in range(len(self._col_names), len(values)))
+        cells = ['<row r="', row_num, '">']
+        for col_name, value in zip(self._col_names, values):
+            if value is None or value == "":
+                continue
+            value_type = type(value)
+            if value_type is XmlText:
+                pass
+            elif value_type is str and not _not_plain_search(value):
+                # Plain ASCII is written as is
+                pass
+            elif isinstance(value, (int, long, float)) and not isinstance(value, bool):
+                # repr keeps all digits of a float; str of a long has no L suffix
+                number = repr(value) if isinstance(value, float) else str(value)
+                cells.extend(('<c r="', col_name, row_num, '"><v>', number, '</v></c>'))
+                continue
+            else:
+                value = xlsx_cell_text(value)
+            cells.extend(('<c r="', col_name, row_num, '" t="inlineStr"><is><t xml:space="preserve">', value, '</t></is></c>'))
+        cells.append('</row>')
+        self._buffer.append("".join(cells))
+        if len(self._buffer) >= XLSX_BUFFER_ROWS:
+            self._flush()
+
+    def close(self):
+        if self._f:
+            self._flush()
+            self._f.write(XLSX_SHEET_END)
+            self._f.close()
+            self._f = None
+
+    def abort(self):
+        if self._f:
+            self._f.close()
+            self._f = None
+        self._buffer = []
+
+    def _flush(self):
+        self._f.write("".join(self._buffer))
+        self._buffer = []
+
+
+def _get_col_name(col):
+    """Returns the column letters for a 0-based column index"""
+    name = ""
+    col += 1
+    while col:
+        col, rem = divmod(col - 1, 26)
+        name = chr(ord("A") + rem) + name
+    return name
@@ -2,364 +2,448 @@
 
 """Requirements Analysis.
 
-USAGE: python reqanalysis.py <in_filename> <out_filename>
+USAGE: python reqanalysis.py [--stream] [--no-cache] [--workers <n>] [--prev-state <file>] [--save-state <file>]
+       [--save-db <file>] [--from-db <file>] [--matrix] [--diagnostics <file>] [--trend-dir <dir>] [--no-trend]
+       [--metrics <file>] [--profile <file>] <in_filename> <out_filename>
+       python reqanalysis.py --from-db <file> [options] <out_filename>
 
-Prerequisites: xtwt, xlrd in virtualenv
+Prerequisites: xlrd in virtualenv (xlwt for .xls reports)
 """
 
 __author__ = 'Michael Meisinger'
 
-import csv
+import argparse
+import bisect
 import datetime
 import os
 import sys
-import xlwt
-from xlsparser import XLSParser
+from outmanifest import OutputManifest
+from reqdelta import ReqDelta, ReqState
+from reqdiag import ReqDiagnostics, DIAG_DUPLICATE_ID, DIAG_MISSING_TARGET, DIAG_DUPLICATE_LINK
+from reqgraph import ReqGraph
+from reqmatrix import MatrixRollup
+from reqmetrics import profiled
+from reqreach import ReachIndex
+from reportwriter import get_report_writer
+from reqrollup import StatusRollup, STATUS_VERIFIED, STATUS_R3, STATUS_R4, STATUS_OUT, ADDRESSED
+from reqsource import ReqParser, InputError
+from reqstore import ReqStore
+from reqtrend import TrendStore, get_rollup_rows, TREND_DIR
+import tracewriter
 
 REQ_FILE = "Req_Export_CI_2013-10-07_ver_0-18.xlsx"
 OUT_FILE_PREFIX = "output/reqanalysis"
 OUT_TRACE_PREFIX = "output/tracing"
+OUT_MANIFEST = "output/manifest_reqanalysis.json"
 
 TAB_L2 = "L2_CU"
 TAB_L3 = "L3_CI"
 TAB_L4 = "L4"
 TAB_MS = "Milestones"
 
-GROUP_MAP = {"0": "VERIFIED", "1": "EXPECTED R3", "2": "EXPECTED R4", "5": "OUT", "4": "UX", "10": "INT"}
-
-HTABLE_START = """
-<div class="panel" style="border-width: 1px;">
-  <div class="panelContent">
-    <h3>%%TITLE%%</h3>
-    <div class='table-wrap'>
-      <table class='confluenceTable'>"""
-
-HTABLE_END = """
-      </table>
-    </div>
-  </div>
-</div>"""
-
-HTABLE_ROW_START = """
-        <tr>"""
-
-HTABLE_ROW_END = """
-        </tr>"""
-
-HTABLE_HEAD_ROW = """
-          <th class='confluenceTh'>%%TEXT%%</th>"""
-
-HTABLE_ROW = """
-          <td class='confluenceTd'>%%TEXT%%</td>"""
-
-HTABLE_SEP = """
-<p>
-  <br class="atl-forced-newline" />
-</p>"""
-
-
-class ReqAnalysis(object):
-    def __init__(self):
-        self.req = {}
-
-    def parse(self, filename):
-        # Load from load xlsx file
-        if os.path.exists(filename):
-            with open(filename, "rb") as f:
-                print "Opened", filename
-                doc_str = f.read()
-                print "Read req file, size=%s" % len(doc_str)
-                xls_parser = XLSParser()
-                self.csv_files = xls_parser.extract_csvs(doc_str)
-                print "Parsed req file OK. Found %s tabs." % len(self.csv_files)
-        else:
-            print "ERROR: Requirements file %s does not exist" % filename
-            sys.exit(1)
-
-        PARSE_TABS = [
-            (TAB_L2, "L2"),
-            (TAB_L3, "L3"),
-            (TAB_L4, "L4"),
-            (TAB_MS, "milestone"),
-        ]
-        for tab, name in PARSE_TABS:
-            tab_rows = self.csv_files[tab]
-            parse_func_name = "_parse_%s" % name
-            if hasattr(self, parse_func_name):
-                parse_func = getattr(self, parse_func_name)
-                reader = csv.DictReader(tab_rows, delimiter=',')
-                print "Parsing tab", tab
-                self._lnum = 0
-                self._add_cnt = 0
-                for row in reader:
-                    res = parse_func(row)
-                    self._lnum += 1
-                    if res:
-                        self._add_cnt += 1
-                print " ...using %s of %s rows" % (self._add_cnt, self._lnum)
-
-    def dump_analysis(self, filename=None):
-        self._wb = xlwt.Workbook()
-        self._worksheets = {}
-
-        l2_req_dict = self.req[TAB_L2]
-        l3_req_dict = self.req[TAB_L3]
-        l4_req_dict = self.req[TAB_L4]
-
-        l3_ws = self._wb.add_sheet("L3")
-        [l3_ws.write(0, col, hdr) for (col, hdr) in enumerate(["L3 ID", "L3 Requirement Statement", "Num L4", "Num Verified", "Num R3", "Num R4", "Num Out", "Num UX/Int", "Status", "Addressed", "Percent"])]
-        self._row_l3 = 1
-
-        ws = self._wb.add_sheet("L3_L4")
-        [ws.write(0, col, hdr) for (col, hdr) in enumerate(["L3 ID", "L3 Requirement Statement", "L4 ID", "L4 Requirement Statement", "Num Parents", "Status"])]
-        self._row = 1
-
-        for l3_req in sorted(l3_req_dict.values(), key=lambda x: x["order"]):
-            req_id = l3_req["req_id"]
-            out_links = l3_req.get("l4_out_links", [])
-            l4_count_by_group = {}
-            l4_count = 0
-            if out_links:
-                for i, link in enumerate(out_links):
-                    l4_count += 1
-                    ws.write(self._row, 0, req_id)
-                    value = unicode(l3_req["req_txt"], "latin1")
-                    ws.write(self._row, 1, value.encode("ascii", "replace"))
-                    ws.write(self._row, 2, link)
-                    l4_req = l4_req_dict.get(link, None)
-                    if l4_req:
-                        value = unicode(l4_req["req_txt"], "latin1")
-                        ws.write(self._row, 3, value.encode("ascii", "replace"))
-                        ws.write(self._row, 4, l4_req["l3_link_parents"])
-                        group = str(l4_req["group"])
-                        ws.write(self._row, 5, GROUP_MAP.get(group, group))
-
-                        if group not in l4_count_by_group:
-                            l4_count_by_group[group] = 0
-                        l4_count_by_group[group] += 1
-                    else:
-                        ws.write(self._row, 3, "ERROR: NOT FOUND")
-                    self._row += 1
+# Tabs to load from the workbook and the _parse_<name> handler for each
+PARSE_TABS = [
+    (TAB_L2, "L2"),
+    (TAB_L3, "L3"),
+    (TAB_L4, "L4"),
+    (TAB_MS, "milestone"),
+]
+
+# Columns read by the _parse_<name> handlers, by tab. No other cells are extracted.
+PARSE_COLUMNS = {
+    TAB_L2: ["ID", "Requirement Statement", "Rationale and Description"],
+    TAB_L3: ["ID", "Requirement Statement", "Item Class", "L2_CU", "Rationale and Description"],
+    TAB_L4: ["ID", "Requirement Statement", "Item Class", "Item Type", "L3 Link", "Group", "Tracing to Milestone",
+             "Tracing to Milestone secondary", "Rationale and Description", "Proposed Change"],
+    TAB_MS: ["ID", "Milestone Name", "Deliverable", "Group"],
+}
+
+GROUP_MAP = {"0": STATUS_VERIFIED, "1": STATUS_R3, "2": STATUS_R4, "5": STATUS_OUT, "4": "UX", "10": "INT"}
+
+# Statuses counted in separate report columns
+COUNT_STATUSES = [STATUS_VERIFIED, STATUS_R3, STATUS_R4, STATUS_OUT]
+
+# Levels with a status rolled up from their children, with the child level label.
+# L4 requirements are leaves with a status from their group.
+ROLLUP_LEVELS = {
+    TAB_L2: "L3",
+    TAB_L3: "L4",
+    TAB_MS: "L4",
+}
+
+# Levels with status transitions in the delta report
+DELTA_LEVELS = [TAB_L2, TAB_L3]
+
+LEVEL_LABELS = {TAB_L2: "L2", TAB_L3: "L3", TAB_L4: "L4", TAB_MS: "Milestone"}
+
+# Levels of upward and downward traces, in order
+TRACE_LEVELS = [TAB_L2, TAB_L3, TAB_L4, TAB_MS]
+
+
+class ReqAnalysis(ReqParser):
+    PARSE_TABS = PARSE_TABS
+    PARSE_COLUMNS = PARSE_COLUMNS
+
+    def __init__(self, metrics=None):
+        ReqParser.__init__(self, metrics)
+        self.graph = ReqGraph()
+        self.diagnostics = ReqDiagnostics()
+        self.delta = None
+        self._reach = None
+
+    def end_parse(self):
+        with self.metrics.phase("index"):
+            self._build_ms_index()
+        self.metrics.counters.update(nodes=len(self.graph.nodes), links=self.graph.num_links,
+                                     diagnostics=self.diagnostics.get_counts())
+
+    def analyze(self, prev_state=None, matrix=False):
+        """Computes the status of all requirements and milestones. Given the ReqState of a
+        previous run, only requirements affected by changes since then are evaluated.
+        With matrix, the status is computed with sparse matrices (requires numpy/scipy)."""
+        with self.metrics.phase("rollup") as counters:
+            self.delta = None
+            if matrix:
+                self.rollup = MatrixRollup(self.graph, ROLLUP_LEVELS, self._get_leaf_status, self._get_child_ids)
             else:
-                ws.write(self._row, 0, req_id)
-                ws.write(self._row, 1, l3_req["req_txt"])
-                self._row += 1
-
-            l3_ws.write(self._row_l3, 0, req_id)
-            value = unicode(l3_req["req_txt"], "latin1")
-            l3_ws.write(self._row_l3, 1, value.encode("ascii", "replace"))
-            l3_ws.write(self._row_l3, 2, l4_count)
-            l4_cnt_ver = l4_count_by_group.get("0", 0)
-            l3_ws.write(self._row_l3, 3, l4_cnt_ver or "")
-            l4_cnt_r3 = l4_count_by_group.get("1", 0)
-            l3_ws.write(self._row_l3, 4, l4_cnt_r3 or "")
-            l4_cnt_r4 = l4_count_by_group.get("2", 0)
-            l3_ws.write(self._row_l3, 5, l4_cnt_r4 or "")
-            l4_cnt_out = l4_count_by_group.get("5", 0)
-            l3_ws.write(self._row_l3, 6, l4_cnt_out or "")
-            l4_cnt_off = l4_count - l4_cnt_ver - l4_cnt_r3 - l4_cnt_r4 - l4_cnt_out
-            l3_ws.write(self._row_l3, 7, l4_cnt_off or "")
-
-            l3_status = ""
-            if not l4_count:
-                if " shall " in l3_req["req_txt"]:
-                    l3_status = "MISSING L4"
-                else:
-                    l3_status = ""
-            elif l4_count == l4_cnt_ver:
-                l3_status = "VERIFIED"
-            elif l4_count == l4_cnt_ver + l4_cnt_r3:
-                l3_status = "EXPECTED R3"
-            elif l4_count == l4_cnt_ver + l4_cnt_r3 + l4_cnt_r4:
-                l3_status = "EXPECTED R4"
-            elif l4_count == l4_cnt_out + l4_cnt_off:
-                l3_status = "OUT"
-            elif l4_cnt_ver or l4_cnt_r3:
-                l3_status = "PARTIAL"
+                self.rollup = StatusRollup(self.graph, ROLLUP_LEVELS, self._get_leaf_status, self._get_child_ids)
+            if prev_state:
+                self.delta = ReqDelta(prev_state, self.graph, self._get_child_ids)
+                counters["changes"] = len(self.delta.changes)
+            if self.delta and not matrix:
+                counters["evaluated"] = len(self.delta.dirty)
+                self.rollup.compute(self.delta.get_known_results())
             else:
-                l3_status = "OTHER"
-            l3_ws.write(self._row_l3, 8, l3_status)
-            l3_req["l3_status"] = l3_status
-
-            if l4_cnt_ver + l4_cnt_r3 > 0:
-                l3_status2 = "ADDRESSED"
-            elif not l3_status:
-                l3_status2 = ""
+                counters["evaluated"] = len(self.graph.nodes)
+                self.rollup.compute()
+
+    def evaluate_scenarios(self, scenarios):
+        """Returns a MatrixRollup of what-if scenarios, given as a list of dicts of L4 ID to
+        a new group. Each scenario is one result column. Does not change self.rollup."""
+        leaf_scenarios = []
+        for scenario in scenarios:
+            leaf_scenario = {}
+            for req_id, group in scenario.iteritems():
+                req = self.graph.get(TAB_L4, req_id)
+                if not req:
+                    print "WARNING: Scenario L4 does not exist: %s" % req_id
+                    continue
+                leaf_scenario[req.idx] = GROUP_MAP.get(str(group), str(group))
+            leaf_scenarios.append(leaf_scenario)
+        with self.metrics.phase("scenarios", scenarios=len(scenarios)):
+            rollup = MatrixRollup(self.graph, ROLLUP_LEVELS, self._get_leaf_status, self._get_child_ids)
+            return rollup.compute(leaf_scenarios)
+
+    def save_store(self, filename, source=None):
+        """Saves the requirements, links, milestone traces and status to a ReqStore"""
+        with self.metrics.phase("save_db"):
+            ReqStore(filename).save(self.graph, self.rollup.results, self.ms_index, source,
+                                    self.diagnostics.get_rows())
+
+    def load_store(self, filename):
+        """Restores the parsed and analyzed state saved by save_store, instead of parse and analyze"""
+        with self.metrics.phase("load_db"):
+            store = ReqStore(filename)
+            self.graph, results, self.ms_index = store.load()
+            # The export the store was saved from, if recorded
+            self.in_filename = store.get_meta().get("source") or None
+            self.diagnostics = ReqDiagnostics()
+            self.diagnostics.add_rows(store.get_diag_rows())
+            self._reach = None
+            self.rollup = StatusRollup(self.graph, ROLLUP_LEVELS, self._get_leaf_status, self._get_child_ids)
+            self.rollup.compute(results)
+            self.delta = None
+        self.metrics.counters.update(nodes=len(self.graph.nodes), links=self.graph.num_links)
+
+    def get_status_counts(self, level):
+        """Returns dict of status to number of requirements of the level with that status,
+        plus the number addressed under ADDRESSED"""
+        counts = {}
+        for req in self.graph.get_level(level):
+            res = self.rollup.get(req)
+            counts[res.status] = counts.get(res.status, 0) + 1
+            if res.addressed == ADDRESSED:
+                counts[ADDRESSED] = counts.get(ADDRESSED, 0) + 1
+        return counts
+
+    def dump_analysis(self, filename=None, manifest=None, trend=None):
+        """Writes the analysis workbook. The format follows the file extension: .xls
+        uses the legacy xlwt writer, anything else the streaming xlsx writer. Given an
+        OutputManifest, an existing file with the same content is not replaced; the
+        timestamped default file is always new and not recorded in the manifest. Given a
+        TrendStore, the status of all requirements is appended to it as a snapshot
+        labeled with the input file name (for a ReqStore, the export it was saved from;
+        not appended if unknown)."""
+        with self.metrics.phase("report") as counters:
+            dtstr = datetime.datetime.today().strftime('%Y%m%d_%H%M%S')
+            path = filename or OUT_FILE_PREFIX + "_%s.xlsx" % dtstr
+            if manifest and filename:
+                root, ext = os.path.splitext(path)
+                tmp_path = root + ".tmp" + ext
+                try:
+                    self._dump_analysis(tmp_path)
+                except Exception:
+                    # Not recorded in the manifest, so not removed as stale later
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
+                counters["written"] = int(manifest.commit_file(tmp_path, path))
             else:
-                l3_status2 = "NOT ADDRESSED"
-            l3_ws.write(self._row_l3, 9, l3_status2)
-            l3_req["l3_status2"] = l3_status2
+                self._dump_analysis(path)
+                counters["written"] = 1
+        if trend and self.in_filename:
+            with self.metrics.phase("trend"):
+                # normpath drops a trailing slash of an input directory
+                label = os.path.basename(os.path.normpath(self.in_filename))
+                trend.append(label, get_rollup_rows(self.graph, self.rollup), source=self.in_filename)
+
+    def _dump_analysis(self, path):
+        self._writer = get_report_writer(path)
+        try:
+            self._write_sheets()
+        except Exception:
+            # Removes the sheet files written so far
+            self._writer.abort()
+            raise
+        self._writer.close()
+
+    def _write_sheets(self):
+        graph = self.graph
+        rollup = self.rollup
+        # Statements are written to many rows; encode each once per node
+        text_encoder = self._writer.text_encoder
+        if text_encoder:
+            req_txt = lambda req: req.encoded("req_txt", text_encoder)
+        else:
+            req_txt = lambda req: req.req_txt
 
-            l3_ws.write(self._row_l3, 10, int(100 * (l4_cnt_ver + l4_cnt_r3) / l4_count) if l4_count else "")
+        l3_ws = self._writer.add_sheet("L3", ["L3 ID", "L3 Requirement Statement", "Num L4", "Num Verified", "Num R3", "Num R4", "Num Out", "Num UX/Int", "Status", "Addressed", "Percent"])
+        ws = self._writer.add_sheet("L3_L4", ["L3 ID", "L3 Requirement Statement", "L4 ID", "L4 Requirement Statement", "Num Parents", "Status"])
 
-            self._row_l3 += 1
+        for l3_req in graph.get_level(TAB_L3):
+            req_id = l3_req.req_id
+            l3_txt = req_txt(l3_req)
+            out_links = graph.children(l3_req)
+            if out_links:
+                for l4_req in out_links:
+                    ws.append([req_id, l3_txt, l4_req.req_id, req_txt(l4_req), l4_req.num_parents, rollup.get(l4_req).status])
+            else:
+                ws.append([req_id, l3_txt])
 
-        # L2-L3 Analysis
+            res = rollup.get(l3_req)
+            l3_ws.append([req_id, l3_txt] + self._get_counts(res) +
+                         [res.status, res.addressed, res.percent if res.percent is not None else ""])
 
-        l2_ws = self._wb.add_sheet("L2")
-        [l2_ws.write(0, col, hdr) for (col, hdr) in enumerate(["L2 ID", "L2 Requirement Statement", "Num L3", "Num Verified", "Num R3", "Num R4", "Num Out", "Num UX/Int", "Num Addressed", "Num Not Addr", "Status", "Addressed", "Percent"])]
-        self._row_l2 = 1
+        # L2-L3 Analysis
 
-        ws = self._wb.add_sheet("L2_L3")
-        [ws.write(0, col, hdr) for (col, hdr) in enumerate(["L2 ID", "L2 Requirement Statement", "L3 ID", "L3 Requirement Statement", "Num Parents", "Status", "Addressed"])]
-        self._row = 1
+        l2_ws = self._writer.add_sheet("L2", ["L2 ID", "L2 Requirement Statement", "Num L3", "Num Verified", "Num R3", "Num R4", "Num Out", "Num UX/Int", "Num Addressed", "Num Not Addr", "Status", "Addressed", "Percent"])
+        ws = self._writer.add_sheet("L2_L3", ["L2 ID", "L2 Requirement Statement", "L3 ID", "L3 Requirement Statement", "Num Parents", "Status", "Addressed"])
 
-        for l2_req in sorted(l2_req_dict.values(), key=lambda x: x["order"]):
-            req_id = l2_req["req_id"]
-            out_links = l2_req.get("l3_out_links", [])
-            l3_count_by_group = {}
-            l3_count = 0
+        for l2_req in graph.get_level(TAB_L2):
+            req_id = l2_req.req_id
+            l2_txt = req_txt(l2_req)
+            out_links = graph.children(l2_req)
             if out_links:
-                for i, link in enumerate(out_links):
-                    l3_count += 1
-                    ws.write(self._row, 0, req_id)
-                    value = unicode(l2_req["req_txt"], "latin1")
-                    ws.write(self._row, 1, value.encode("ascii", "replace"))
-                    ws.write(self._row, 2, link)
-                    l3_req = l3_req_dict.get(link, None)
-                    if l3_req:
-                        value = unicode(l3_req["req_txt"], "latin1")
-                        ws.write(self._row, 3, value.encode("ascii", "replace"))
-                        ws.write(self._row, 4, l3_req["l2_link_parents"])
-                        group = str(l3_req["l3_status"])
-                        ws.write(self._row, 5, group)
-                        if group not in l3_count_by_group:
-                            l3_count_by_group[group] = 0
-                        l3_count_by_group[group] += 1
-                        group2 = str(l3_req["l3_status2"])
-                        ws.write(self._row, 6, group2)
-                        if group2 not in l3_count_by_group:
-                            l3_count_by_group[group2] = 0
-                        l3_count_by_group[group2] += 1
-                    else:
-                        ws.write(self._row, 3, "ERROR: NOT FOUND")
-                    self._row += 1
+                for l3_req in out_links:
+                    l3_res = rollup.get(l3_req)
+                    ws.append([req_id, l2_txt, l3_req.req_id, req_txt(l3_req), l3_req.num_parents, l3_res.status, l3_res.addressed])
             else:
-                ws.write(self._row, 0, req_id)
-                ws.write(self._row, 1, l2_req["req_txt"])
-                self._row += 1
-
-            l2_ws.write(self._row_l2, 0, req_id)
-            value = unicode(l2_req["req_txt"], "latin1")
-            l2_ws.write(self._row_l2, 1, value.encode("ascii", "replace"))
-            l2_ws.write(self._row_l2, 2, l3_count)
-            l4_cnt_ver = l3_count_by_group.get("VERIFIED", 0)
-            l2_ws.write(self._row_l2, 3, l4_cnt_ver or "")
-            l4_cnt_r3 = l3_count_by_group.get("EXPECTED R3", 0)
-            l2_ws.write(self._row_l2, 4, l4_cnt_r3 or "")
-            l4_cnt_r4 = l3_count_by_group.get("EXPECTED R4", 0)
-            l2_ws.write(self._row_l2, 5, l4_cnt_r4 or "")
-            l4_cnt_out = l3_count_by_group.get("OUT", 0)
-            l2_ws.write(self._row_l2, 6, l4_cnt_out or "")
-            l4_cnt_off = l3_count - l4_cnt_ver - l4_cnt_r3 - l4_cnt_r4 - l4_cnt_out
-            l2_ws.write(self._row_l2, 7, l4_cnt_off or "")
-            l3_cnt_add = l3_count_by_group.get("ADDRESSED", 0)
-            l2_ws.write(self._row_l2, 8, l3_cnt_add or "")
-            l3_cnt_nadd = l3_count_by_group.get("NOT ADDRESSED", 0)
-            l2_ws.write(self._row_l2, 9, l3_cnt_nadd or "")
-
-            l2_status = ""
-            if not l3_count:
-                if " shall " in l2_req["req_txt"]:
-                    l2_status = "MISSING L3"
+                ws.append([req_id, l2_txt])
+
+            res = rollup.get(l2_req)
+            l2_ws.append([req_id, l2_txt] + self._get_counts(res) +
+                         [res.num_addressed or "", res.num_not_addressed or "",
+                          res.status, res.addressed, res.percent if res.percent is not None else ""])
+
+        if self.delta:
+            self._dump_delta()
+        if self.diagnostics:
+            self.diagnostics.write_sheet(self._writer)
+
+    def _dump_delta(self):
+        ws = self._writer.add_sheet("Delta", ["Level", "ID", "Old Status", "New Status", "Old Addressed", "New Addressed", "Old Percent", "New Percent"])
+        for level, req_id, old_res, new_res in self.delta.get_transitions(self.rollup, DELTA_LEVELS):
+            row = [LEVEL_LABELS[level], req_id] + [""] * 6
+            for col, res in ((2, old_res), (3, new_res)):
+                if res:
+                    row[col] = res.status
+                    row[col + 2] = res.addressed
+                    row[col + 4] = res.percent if res.percent is not None else ""
                 else:
-                    l2_status = ""
-            elif l3_count == l4_cnt_ver:
-                l2_status = "VERIFIED"
-            elif l3_count == l4_cnt_ver + l4_cnt_r3:
-                l2_status = "EXPECTED R3"
-            elif l3_count == l4_cnt_ver + l4_cnt_r3 + l4_cnt_r4:
-                l2_status = "EXPECTED R4"
-            elif l3_count == l4_cnt_out + l4_cnt_off:
-                l2_status = "OUT"
-            elif l4_cnt_ver or l4_cnt_r3:
-                l2_status = "PARTIAL"
+                    row[col] = "REMOVED" if col == 3 else "ADDED"
+            ws.append(row)
+
+        ws = self._writer.add_sheet("Changes", ["Level", "ID", "Change", "Details"])
+        for level, req_id, change, details in self.delta.changes:
+            ws.append([LEVEL_LABELS[level], req_id, change, details])
+
+    def _get_counts(self, res):
+        """Returns child count and counts by status as 6 column values"""
+        return ([res.count] + [res.counts.get(status, 0) or "" for status in COUNT_STATUSES] +
+                [res.num_other or ""])
+
+    def get_ms_trace(self, ms):
+        """Returns the L2s, L3s and L4s traced to a milestone, by level and in order"""
+        graph = self.graph
+        ms_reqs = self.ms_index[ms.idx]
+        trace = []
+        for level in (TAB_L2, TAB_L3, TAB_L4):
+            trace.extend(sorted((graph.nodes[idx] for idx in ms_reqs[level]), key=lambda req: req.order))
+        return trace
+
+    def get_reach(self):
+        """Returns the ReachIndex of the graph, with milestones as parents of their L4s.
+        It is built on first use, as only trace queries need it."""
+        if self._reach is None:
+            with self.metrics.phase("reach"):
+                self._reach = ReachIndex(self.graph, self._get_child_ids)
+        return self._reach
+
+    def trace_up(self, req, levels=None):
+        """Returns the requirements a requirement or milestone is ultimately derived from,
+        and the milestones it is delivered in via its L4s, by level and in order"""
+        graph, reach = self.graph, self.get_reach()
+        trace = []
+        for level in levels or TRACE_LEVELS:
+            if level == TAB_MS and req.level != TAB_MS:
+                l4_ids = [req.idx] if req.level == TAB_L4 else reach.descendant_ids(req, TAB_L4)
+                ms_ids = set()
+                for l4_id in l4_ids:
+                    ms_ids.update(reach.ancestor_ids(graph.nodes[l4_id], TAB_MS))
+                trace.extend(sorted((graph.nodes[idx] for idx in ms_ids), key=lambda ms: ms.order))
             else:
-                l2_status = "OTHER"
-            l2_ws.write(self._row_l2, 10, l2_status)
-            l2_req["l2_status"] = l2_status
-
-            if not l3_count:
-                l2_status2 = ""
-            elif l3_cnt_add:
-                l2_status2 = "ADDRESSED"
-            else:
-                l2_status2 = "NOT ADDRESSED"
-            l2_ws.write(self._row_l2, 11, l2_status2)
-            l2_req["l2_status"] = l2_status2
-
-            l2_ws.write(self._row_l2, 12, int(100 * (l4_cnt_ver + l4_cnt_r3) / l3_count) if l3_count else "")
-
-            self._row_l2 += 1
-
-        dtstr = datetime.datetime.today().strftime('%Y%m%d_%H%M%S')
-        path = filename or OUT_FILE_PREFIX + "_%s.xls" % dtstr
-        self._wb.save(path)
-
-    def dump_trace_files(self):
-        ms_dict = self.req[TAB_MS]
-
-        l2_req_dict = self.req[TAB_L2]
-        l3_req_dict = self.req[TAB_L3]
-        l4_req_dict = self.req[TAB_L4]
-
-        for ms in sorted(ms_dict.values(), key=lambda x: x["order"]):
-            if not ms["group"] or int(ms["group"]) != 1:
+                trace.extend(reach.ancestors(req, level))
+        return trace
+
+    def trace_down(self, req, levels=None):
+        """Returns all requirements a requirement or milestone is ultimately rolled up from,
+        by level and in order"""
+        trace = []
+        for level in levels or TRACE_LEVELS:
+            trace.extend(self.get_reach().descendants(req, level))
+        return trace
+
+    def get_children(self, req):
+        """Returns the child requirements a requirement's or milestone's status is rolled up from"""
+        return [self.graph.nodes[idx] for idx in self._get_child_ids(req)]
+
+    def dump_trace_files(self, workers=None, manifest=None):
+        """Writes a trace page per milestone. Unchanged pages are not rewritten. Given an
+        OutputManifest, pages of milestones that no longer exist are removed."""
+        with self.metrics.phase("trace") as counters:
+            removed = len(manifest.removed) if manifest else 0
+            counters["pages"], counters["written"] = self._dump_trace_files(workers, manifest)
+            counters["removed"] = len(manifest.removed) - removed if manifest else 0
+
+    def _dump_trace_files(self, workers, manifest):
+        graph = self.graph
+        pages = []
+
+        for ms in graph.get_level(TAB_MS):
+            if not ms.group or int(ms.group) != 1:
                 continue
 
-            ms_id = ms["ms_id"]
-
-            if not os.path.exists(OUT_TRACE_PREFIX):
-                os.makedirs(OUT_TRACE_PREFIX)
-
-            ms_filename = "%s/%s.html" % (OUT_TRACE_PREFIX, ms_id)
-            with open(ms_filename, "w") as f:
-                f.write(HTABLE_START.replace("%%TITLE%%", "Requirements for %s" % ms_id))
-                f.write(HTABLE_ROW_START)
-                f.write(HTABLE_HEAD_ROW.replace("%%TEXT%%", "Level"))
-                f.write(HTABLE_HEAD_ROW.replace("%%TEXT%%", "Requirement ID"))
-                f.write(HTABLE_HEAD_ROW.replace("%%TEXT%%", "Requirements Statement"))
-                f.write(HTABLE_HEAD_ROW.replace("%%TEXT%%", "Rationale and Description"))
-                f.write(HTABLE_ROW_END)
-
-                ms_l4 = [l4r for l4r in l4_req_dict.values() if l4r["req_ms1"].startswith(ms_id) or l4r["req_ms2"].startswith(ms_id)]
-                ms_l3_ids = set()
-                for l4r in ms_l4:
-                    ms_l3_ids.update(l4r.get("l3_links", []))
-                print ms_id, "L3", ms_l3_ids
-                ms_l3 = [l3_req_dict[l3id] for l3id in ms_l3_ids if l3id in l3_req_dict]
-                ms_l2_ids = set()
-                for l3r in ms_l3:
-                    ms_l2_ids.update(l3r.get("l2_links", []))
-                print ms_id, "L2", ms_l2_ids
-                ms_l2 = [l2_req_dict[l2id] for l2id in ms_l2_ids if l2id in l2_req_dict]
-
-                for level, req_list in (("L2", ms_l2), ("L3", ms_l3), ("L4", ms_l4)):
-                    for req in req_list:
-                        f.write(HTABLE_ROW_START)
-                        f.write(HTABLE_ROW.replace("%%TEXT%%", level))
-                        f.write(HTABLE_ROW.replace("%%TEXT%%", req["req_id"]))
-                        f.write(HTABLE_ROW.replace("%%TEXT%%", req["req_txt"]))
-                        f.write(HTABLE_ROW.replace("%%TEXT%%", req["desc"]))
-                        f.write(HTABLE_ROW_END)
-
-                f.write(HTABLE_END)
-
-    def do_all(self, in_filename=None, out_filename=None):
-        self.parse(in_filename or REQ_FILE)
-        self.dump_analysis(out_filename)
-
-        self.dump_trace_files()
+            ms_id = ms.req_id
+            rows = [(LEVEL_LABELS[req.level], req.req_id, req.encoded("req_txt", tracewriter.PAGE_ENCODING),
+                     req.encoded("desc", tracewriter.PAGE_ENCODING)) for req in self.get_ms_trace(ms)]
+            pages.append(("%s/%s.html" % (OUT_TRACE_PREFIX, ms_id),
+                          "Requirements for %s" % ms_id,
+                          ["Level", "Requirement ID", "Requirements Statement", "Rationale and Description"],
+                          rows))
+
+        written = tracewriter.write_pages(pages, OUT_TRACE_PREFIX, workers, manifest)
+        return len(pages), written
+
+    def do_all(self, in_filename=None, out_filename=None, use_cache=True, streaming=False,
+               prev_state_filename=None, state_filename=None, workers=None,
+               metrics_filename=None, profile_filename=None, db_filename=None, from_db_filename=None,
+               matrix=False, diag_filename=None, trend_dir=None, use_trend=True):
+        in_filename = from_db_filename or in_filename or REQ_FILE
+        with profiled(profile_filename):
+            if from_db_filename:
+                self.load_store(from_db_filename)
+            else:
+                self.parse(in_filename, use_cache=use_cache, streaming=streaming)
+                prev_state = ReqState.load(prev_state_filename) if prev_state_filename else None
+                self.analyze(prev_state, matrix=matrix)
+            if db_filename:
+                self.save_store(db_filename, source=self.in_filename)
+            if state_filename:
+                ReqState.from_analysis(self.graph, self.rollup).save(state_filename)
+            manifest = OutputManifest(OUT_MANIFEST)
+            self.dump_analysis(out_filename, manifest, TrendStore(trend_dir) if use_trend else None)
+
+            self.dump_trace_files(workers, manifest)
+            manifest.save()
+
+        self.print_summary(in_filename)
+        print " " + self.metrics.get_summary()
+        if diag_filename:
+            self.diagnostics.save_csv(diag_filename)
+        if metrics_filename:
+            self.metrics.save(metrics_filename)
+
+    def print_summary(self, in_filename):
+        counters = self.metrics.counters
+        print "Analyzed %s: %s requirements and milestones, %s links, %s diagnostics" % (
+            in_filename, counters["nodes"], counters["links"], len(self.diagnostics))
+        if self.diagnostics:
+            print " " + self.diagnostics.get_summary()
+        if self.delta:
+            print " %s changes since previous state, evaluated %s nodes" % (
+                len(self.delta.changes), self.metrics.get_phase_counters("rollup")["evaluated"])
+        report_counters = self.metrics.get_phase_counters("report")
+        if report_counters:
+            print " Report %s" % ("written" if report_counters.get("written") else "unchanged")
+        trace_counters = self.metrics.get_phase_counters("trace")
+        if trace_counters:
+            print " Wrote %s of %s trace pages, removed %s" % (
+                trace_counters["written"], trace_counters["pages"], trace_counters["removed"])
 
     # -------------------------------------------------------------------------
 
-    def _add_req(self, level, req_id, req):
-        if not level in self.req:
-            self.req[level] = {}
-        req_dict = self.req[level]
-        if req_id in req_dict:
-            print "WARNING: Duplicate %s" % req_id
-        req_dict[req_id] = req
+    def _add_req(self, level, req_id, **attrs):
+        if self.graph.get(level, req_id):
+            self.diagnostics.add(DIAG_DUPLICATE_ID, self._tab, self._row_num, req_id)
+        return self.graph.add_node(level, req_id, **attrs)
+
+    def _get_leaf_status(self, req):
+        group = str(req.group)
+        return GROUP_MAP.get(group, group)
+
+    def _get_child_ids(self, req):
+        if req.level == TAB_MS:
+            return sorted(self.ms_index[req.idx][TAB_L4])
+        return self.graph.child_ids(req)
+
+    def _build_ms_index(self):
+        """Builds self.ms_index, mapping the node ID of each milestone to the sets of node IDs
+        of the L4s tracing to it and of the L3s and L2s reached from these. An L4 traces
+        to a milestone if its primary or secondary milestone field starts with the
+        milestone ID."""
+        graph = self.graph
+
+        l4_by_ms_value = {}
+        for l4r in graph.get_level(TAB_L4):
+            for ms_value in set((l4r.req_ms1, l4r.req_ms2)):
+                l4_by_ms_value.setdefault(ms_value, []).append(l4r.idx)
+        ms_values = sorted(l4_by_ms_value)
+
+        self.ms_index = {}
+        for ms in graph.get_level(TAB_MS):
+            l4_ids = set()
+            # All values with prefix ms_id are adjacent in sort order
+            pos = bisect.bisect_left(ms_values, ms.req_id)
+            while pos < len(ms_values) and ms_values[pos].startswith(ms.req_id):
+                l4_ids.update(l4_by_ms_value[ms_values[pos]])
+                pos += 1
+            l3_ids = set()
+            for l4_id in l4_ids:
+                l3_ids.update(graph.parent_ids(graph.nodes[l4_id]))
+            l2_ids = set()
+            for l3_id in l3_ids:
+                l2_ids.update(graph.parent_ids(graph.nodes[l3_id]))
+            self.ms_index[ms.idx] = {TAB_L4: l4_ids, TAB_L3: l3_ids, TAB_L2: l2_ids}
 
     def _build_req_links(self, field, prefix):
         result = []
@@ -370,21 +454,16 @@ class ReqAnalysis(object):
             result.extend(prefix + link.strip() for link in links)
         return result
 
-    def _add_req_links(self, req_id, links, targ, targ_attr):
-        """Adds given req_id to target requirement for each link in links"""
-        targ_req_dict = self.req[targ]
+    def _add_req_links(self, req, links, targ):
+        """Links given requirement as child of the target level requirement for each link in links"""
         for link in links:
-            targ_req = targ_req_dict.get(link, None)
+            targ_req = self.graph.get(targ, link)
             if not targ_req:
-                print " WARNING: Link %s target does not exist: %s " % (req_id, link)
+                self.diagnostics.add(DIAG_MISSING_TARGET, self._tab, self._row_num, req.req_id, link)
                 continue
 
-            if targ_attr not in targ_req:
-                targ_req[targ_attr] = []
-            targ_link_list = targ_req[targ_attr]
-            if req_id in targ_link_list:
-                print " WARNING: Link to %s already present: %s" % (link, req_id)
-            targ_link_list.append(req_id)
+            if not self.graph.add_link(targ_req, req):
+                self.diagnostics.add(DIAG_DUPLICATE_LINK, self._tab, self._row_num, req.req_id, link)
 
     # -------------------------------------------------------------------------
 
@@ -398,20 +477,17 @@ class ReqAnalysis(object):
         req_txt = row["Requirement Statement"]
         if row["Proposed Change"].strip() and not "Deprecate" in row["Item Type"]:
             req_txt = row["Proposed Change"]
-        req_dict = dict(
-            req_id=req_id,
+        req = self._add_req(TAB_L4, req_id,
             req_txt=req_txt,
             item_type=row["Item Type"],
-            l3_links=l3_links,
-            l3_link_parents=len(l3_links),
+            num_parents=len(l3_links),
             group=row["Group"],
             req_ms1=row["Tracing to Milestone"],
             req_ms2=row["Tracing to Milestone secondary"],
             desc=row["Rationale and Description"],
             order=self._lnum
         )
-        self._add_req(TAB_L4, req_id, req_dict)
-        self._add_req_links(req_id, l3_links, TAB_L3, "l4_out_links")
+        self._add_req_links(req, l3_links, TAB_L3)
 
         return True
 
@@ -425,44 +501,67 @@ class ReqAnalysis(object):
 
         req_id = row["ID"]
         l2_links = self._build_req_links(row["L2_CU"], "L2-CU-RQ-")
-        req_dict = dict(
-            req_id=req_id,
+        req = self._add_req(TAB_L3, req_id,
             req_txt=req_txt,
-            l2_links=l2_links,
-            l2_link_parents=len(l2_links),
+            num_parents=len(l2_links),
             desc=row["Rationale and Description"],
             order=self._lnum
         )
-        self._add_req(TAB_L3, req_id, req_dict)
-        self._add_req_links(req_id, l2_links, TAB_L2, "l3_out_links")
+        self._add_req_links(req, l2_links, TAB_L2)
         return True
 
     def _parse_L2(self, row):
         req_id = row["ID"]
-        req_dict = dict(
-            req_id=req_id,
+        self._add_req(TAB_L2, req_id,
             req_txt=row["Requirement Statement"],
             desc=row["Rationale and Description"],
             order=self._lnum
         )
-        self._add_req(TAB_L2, req_id, req_dict)
         return True
 
     def _parse_milestone(self, row):
         ms_id = row["ID"]
-        ms_dict = dict(
-            ms_id=ms_id,
-            ms_txt=row["Milestone Name"],
+        self._add_req(TAB_MS, ms_id,
+            req_txt=row["Milestone Name"],
             deliverable=row["Deliverable"],
             group=row["Group"],
             order=self._lnum
         )
-        self._add_req(TAB_MS, ms_id, ms_dict)
         return True
 
 if __name__ == '__main__':
-    in_filename = sys.argv[1] if len(sys.argv) >= 2 else None
-    out_filename = sys.argv[2] if len(sys.argv) >= 3 else None
+    parser = argparse.ArgumentParser(description="Requirements Analysis")
+    parser.add_argument("in_filename", nargs="?",
+                        help="requirements xlsx file or directory of per-tab CSV/TSV files (default: %s)" % REQ_FILE)
+    parser.add_argument("out_filename", nargs="?", help="output file name")
+    parser.add_argument("--stream", action="store_true", help="stream xlsx rows instead of loading the workbook")
+    parser.add_argument("--no-cache", action="store_true", help="do not use the extracted worksheet cache")
+    parser.add_argument("--workers", type=int, default=tracewriter.TRACE_WORKERS,
+                        help="number of processes writing trace files (default: %(default)s)")
+    parser.add_argument("--prev-state", help="state file of a previous run; adds Delta and Changes sheets")
+    parser.add_argument("--save-state", help="file to save this run's state to")
+    parser.add_argument("--save-db", help="SQLite file to store the analyzed requirements in")
+    parser.add_argument("--from-db", help="SQLite file to load analyzed requirements from instead of parsing")
+    parser.add_argument("--matrix", action="store_true", help="compute status with sparse matrices (requires numpy, scipy)")
+    parser.add_argument("--diagnostics", help="CSV file to write duplicate IDs and link problems to")
+    parser.add_argument("--trend-dir", help="coverage trend store to append this run to (default: %s)" % TREND_DIR)
+    parser.add_argument("--no-trend", action="store_true", help="do not append this run to the coverage trend store")
+    parser.add_argument("--metrics", help="JSON file to write phase times, counts and peak memory to")
+    parser.add_argument("--profile", help="file to write cProfile stats of the run to")
+    args = parser.parse_args()
+    if args.from_db and args.in_filename:
+        # No input is parsed: a single file name is the output
+        if args.out_filename:
+            parser.error("only out_filename can be given with --from-db")
+        args.in_filename, args.out_filename = None, args.in_filename
 
     ra = ReqAnalysis()
-    ra.do_all(in_filename, out_filename)
+    try:
+        ra.do_all(args.in_filename, args.out_filename, use_cache=not args.no_cache, streaming=args.stream,
+                  prev_state_filename=args.prev_state, state_filename=args.save_state, workers=args.workers,
+                  metrics_filename=args.metrics, profile_filename=args.profile,
+                  db_filename=args.save_db, from_db_filename=args.from_db, matrix=args.matrix,
+                  diag_filename=args.diagnostics, trend_dir=args.trend_dir, use_trend=not args.no_trend)
+    except InputError as ex:
+        print "ERROR: %s" % ex
+        sys.exit(1)
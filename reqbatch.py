@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+"""Batch Requirements Analysis.
+
+Analyzes a set of requirements exports in parallel, writing an analysis report per
+export and a summary of status counts across all of them.
+
+USAGE: python reqbatch.py [--workers <n>] [--out-dir <dir>] [--trend-dir <dir>] [--no-trend] <directory or glob>
+
+The status of all requirements of each export is appended to the coverage trend store,
+in the order of the file names.
+"""
+
+__author__ = 'Michael Meisinger'
+
+import argparse
+import datetime
+import glob
+import multiprocessing
+import os
+import sys
+
+from reportwriter import get_report_writer
+from reqanalysis import ReqAnalysis, TAB_L2, TAB_L3, LEVEL_LABELS
+from reqrollup import STATUS_VERIFIED, STATUS_R3, STATUS_R4, STATUS_OUT, STATUS_PARTIAL, STATUS_OTHER, ADDRESSED
+from reqtrend import TrendStore, get_rollup_rows, TREND_DIR
+
+OUT_BATCH_DIR = "output/batch"
+IN_FILE_PATTERNS = ["*.xlsx", "*.xls"]
+
+SUMMARY_LEVELS = [TAB_L2, TAB_L3]
+SUMMARY_STATUSES = [STATUS_VERIFIED, STATUS_R3, STATUS_R4, STATUS_OUT, STATUS_PARTIAL, STATUS_OTHER, ADDRESSED]
+
+
+def find_input_files(path):
+    """Returns the sorted export files in a directory or matching a glob pattern"""
+    if os.path.isdir(path):
+        filenames = []
+        for pattern in IN_FILE_PATTERNS:
+            filenames.extend(glob.glob(os.path.join(path, pattern)))
+    else:
+        filenames = glob.glob(path)
+    return sorted(set(filenames))
+
+
+def analyze_snapshot(args):
+    """Parses and analyzes one export and writes its report. Returns a tuple
+    (in_filename, dict of level to status counts, error message, trend rows)"""
+    in_filename, out_filename, use_cache, use_trend = args
+    try:
+        ra = ReqAnalysis()
+        ra.parse(in_filename, use_cache=use_cache)
+        ra.analyze()
+        ra.dump_analysis(out_filename)
+        counts = dict((level, ra.get_status_counts(level)) for level in SUMMARY_LEVELS)
+        counts.update(("num_%s" % level, ra.graph.level_size(level)) for level in SUMMARY_LEVELS)
+        # Appended to the trend store by the parent process, in order
+        trend_rows = get_rollup_rows(ra.graph, ra.rollup) if use_trend else None
+        return in_filename, counts, None, trend_rows
+    except Exception as ex:
+        return in_filename, None, "%s: %s" % (ex.__class__.__name__, ex), None
+
+
+class ReqBatch(object):
+    def __init__(self, out_dir=None, workers=None, use_cache=True, trend_dir=None, use_trend=True):
+        self.out_dir = out_dir or OUT_BATCH_DIR
+        self.workers = workers or multiprocessing.cpu_count()
+        self.use_cache = use_cache
+        self.trend = TrendStore(trend_dir) if use_trend else None
+        self.results = []
+
+    def analyze_all(self, filenames):
+        if not os.path.exists(self.out_dir):
+            os.makedirs(self.out_dir)
+        jobs = [(filename, self._get_report_filename(filename), self.use_cache, bool(self.trend))
+                for filename in filenames]
+        workers = min(self.workers, len(jobs))
+        if workers <= 1:
+            self.results = map(analyze_snapshot, jobs)
+        else:
+            pool = multiprocessing.Pool(workers)
+            try:
+                self.results = pool.map(analyze_snapshot, jobs, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        for in_filename, counts, error, trend_rows in self.results:
+            if error:
+                print "ERROR: Analysis of %s failed: %s" % (in_filename, error)
+            elif self.trend:
+                self.trend.append(os.path.basename(in_filename), trend_rows, source=in_filename)
+
+    def dump_summary(self, filename=None):
+        header = ["Snapshot"]
+        for level in SUMMARY_LEVELS:
+            label = LEVEL_LABELS[level]
+            header.append("Num %s" % label)
+            header.extend("%s %s" % (label, status) for status in SUMMARY_STATUSES)
+        header.append("Error")
+
+        dtstr = datetime.datetime.today().strftime('%Y%m%d_%H%M%S')
+        path = filename or os.path.join(self.out_dir, "summary_%s.xlsx" % dtstr)
+        writer = get_report_writer(path)
+        ws = writer.add_sheet("Summary", header)
+        for in_filename, counts, error, trend_rows in self.results:
+            row = [os.path.basename(in_filename)]
+            if error:
+                row.extend([""] * (len(header) - 2))
+                row.append(error)
+            else:
+                for level in SUMMARY_LEVELS:
+                    row.append(counts["num_%s" % level])
+                    row.extend(counts[level].get(status, 0) for status in SUMMARY_STATUSES)
+            ws.append(row)
+        writer.close()
+        print "Wrote summary of %s snapshots to %s" % (len(self.results), path)
+
+    def _get_report_filename(self, in_filename):
+        return os.path.join(self.out_dir, os.path.basename(in_filename) + "_analysis.xlsx")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Batch Requirements Analysis")
+    parser.add_argument("in_path", help="directory of requirements exports or glob pattern")
+    parser.add_argument("--out-dir", help="output directory (default: %s)" % OUT_BATCH_DIR)
+    parser.add_argument("--summary", help="summary file name")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(),
+                        help="number of exports analyzed in parallel (default: %(default)s)")
+    parser.add_argument("--no-cache", action="store_true", help="do not use the extracted worksheet cache")
+    parser.add_argument("--trend-dir", help="coverage trend store to append the exports to (default: %s)" % TREND_DIR)
+    parser.add_argument("--no-trend", action="store_true", help="do not append to the coverage trend store")
+    args = parser.parse_args()
+
+    filenames = find_input_files(args.in_path)
+    if not filenames:
+        print "ERROR: No requirements files found for %s" % args.in_path
+        sys.exit(1)
+
+    batch = ReqBatch(args.out_dir, args.workers, use_cache=not args.no_cache, trend_dir=args.trend_dir,
+                     use_trend=not args.no_trend)
+    batch.analyze_all(filenames)
+    batch.dump_summary(args.summary)
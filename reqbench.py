@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+
+"""Benchmarks for the requirements tools on synthetic workbooks.
+
+USAGE: python reqbench.py generate [--l4 <n>] [--seed <n>] ... <out_filename>
+       python reqbench.py suite [--sizes <n,n,...>] [--label <label>] [--workers <n>] [--seed <n>] ...
+       python reqbench.py run [--workers <n>] <in_filename> <result_filename>
+       python reqbench.py compare <result_filename> <result_filename>
+
+generate writes a synthetic requirements export (.xlsx) with the tabs and columns that
+reqanalysis and reqgen read. suite generates a workbook per size, with the same fan-out
+and milestone options as generate, and benchmarks each in a fresh process, saving the
+phase times and peak memory as JSON to output/bench.
+"""
+
+__author__ = 'Michael Meisinger'
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from reportwriter import XlsxReportWriter
+from reqmetrics import get_peak_memory, format_memory
+from xlsparser import XLSParser, PARSER_VERSION
+import reqanalysis
+import reqgen
+import tracewriter
+
+OUT_BENCH_DIR = "output/bench"
+BENCH_SIZES = [1000, 10000, 50000, 200000]
+
+L2_COLUMNS = ["ID", "Requirement Statement", "Rationale and Description"]
+L3_COLUMNS = ["ID", "Requirement Statement", "Item Class", "L2_CU", "Rationale and Description"]
+L4_COLUMNS = ["ID", "Requirement Statement", "Item Class", "Item Type", "L3 Link", "Group",
+              "Tracing to Milestone", "Tracing to Milestone secondary", "Rationale and Description",
+              "Proposed Change"]
+MS_COLUMNS = ["ID", "Milestone Name", "Deliverable", "Group"]
+TRACING_COLUMNS = ["Sort ID", "Activated", "Subject Domain", "Subject ID", "Subject Title", "Relationship",
+                   "Object Title", "Sub-Relationship", "Subobject Title", "Description"]
+
+# Groups of L4 requirements with their relative frequency
+L4_GROUPS = ["0"] * 4 + ["1"] * 3 + ["2"] * 2 + ["5", "4", "10", ""]
+
+
+def generate_workbook(filename, num_l4=1000, l4_per_l3=5, l3_per_l2=4, max_parents=2,
+                      num_ms=50, num_tracing=None, seed=1):
+    """Writes a synthetic requirements export with num_l4 L4 requirements. Each L4 links
+    to 1..max_parents L3s, each L3 to 1..max_parents L2s. L4s trace to random milestones."""
+    rnd = random.Random(seed)
+    num_l3 = max(1, num_l4 / l4_per_l3)
+    num_l2 = max(1, num_l3 / l3_per_l2)
+    num_tracing = num_ms * 20 if num_tracing is None else num_tracing
+
+    def links(num_targets):
+        return "\n".join(str(rnd.randrange(num_targets)) for i in range(rnd.randint(1, max_parents)))
+
+    def ms_id():
+        return "MS-%d" % rnd.randrange(num_ms)
+
+    writer = XlsxReportWriter(filename)
+    ws = writer.add_sheet(reqanalysis.TAB_L2, L2_COLUMNS)
+    for i in xrange(num_l2):
+        ws.append(["L2-CU-RQ-%d" % i,
+                   "The system shall provide capability %d" % i if i % 10 else "Heading %d" % i,
+                   "Rationale for L2 requirement %d" % i])
+    ws = writer.add_sheet(reqanalysis.TAB_L3, L3_COLUMNS)
+    for i in xrange(num_l3):
+        ws.append(["L3-CI-RQ-%d" % i, "The CI shall support function %d" % i, "Approved Req",
+                   links(num_l2), "Rationale for L3 requirement %d" % i])
+    ws = writer.add_sheet(reqanalysis.TAB_L4, L4_COLUMNS)
+    for i in xrange(num_l4):
+        ws.append(["L4-CI-%d" % i, "The component shall implement item %d" % i,
+                   rnd.choice(["Approved Req", "Approved Req", "Approved Int", "Draft"]),
+                   rnd.choice(["Func"] * 9 + ["Deprecate Func"]),
+                   links(num_l3), rnd.choice(L4_GROUPS),
+                   ms_id(), rnd.choice(["", "", ms_id()]),
+                   "Rationale and description of L4 requirement %d" % i,
+                   rnd.choice([""] * 9 + ["Changed statement %d" % i])])
+    ws = writer.add_sheet(reqanalysis.TAB_MS, MS_COLUMNS)
+    for i in xrange(num_ms):
+        ws.append(["MS-%d" % i, "Milestone %d" % i, "Deliverable %d" % i, rnd.choice(["1", "1", "1", "0"])])
+    ws = writer.add_sheet(reqgen.TAB_TRACING, TRACING_COLUMNS)
+    for i in xrange(num_tracing):
+        subject = rnd.randrange(num_ms)
+        ws.append([i, rnd.choice(["1"] * 9 + ["0"]), rnd.choice(["Milestone"] * 9 + ["Other"]),
+                   "MS-%d" % subject, "Milestone %d" % subject, "requires", "Object %d" % i,
+                   "verified by", "Subobject %d" % i, "Tracing item %d" % i])
+    writer.close()
+
+
+class ReqBenchmark(object):
+    """Times the phases of reqanalysis and reqgen on one workbook. Peak memory per phase
+    is the process high-water mark at the end of the phase."""
+
+    def __init__(self, filename, workers=None):
+        self.filename = filename
+        self.workers = workers
+        self.phases = []
+
+    def run(self):
+        with open(self.filename, "rb") as f:
+            doc_str = self._measure("read", f.read)
+        sheets = self._measure("extract", self._extract, doc_str, reqanalysis.ReqAnalysis)
+        ra = reqanalysis.ReqAnalysis()
+        self._measure("parse", self._parse, ra, sheets)
+        del sheets
+        self._measure("rollup", ra.analyze)
+        report_filename = reqanalysis.OUT_FILE_PREFIX + "_bench.xlsx"
+        if not os.path.exists(os.path.dirname(report_filename)):
+            os.makedirs(os.path.dirname(report_filename))
+        self._measure("report", ra.dump_analysis, report_filename)
+        self._measure("trace", ra.dump_trace_files, self.workers)
+
+        sheets = self._measure("reqgen_extract", self._extract, doc_str, reqgen.ReqAnalysis)
+        del doc_str
+        rg = reqgen.ReqAnalysis()
+        self._measure("reqgen_parse", self._parse, rg, sheets)
+        del sheets
+        self._measure("reqgen_trace", rg.dump_trace_files, self.workers)
+
+        return dict(filename=os.path.basename(self.filename),
+                    size=os.path.getsize(self.filename),
+                    num_nodes=len(ra.graph.nodes),
+                    num_links=ra.graph.num_links,
+                    phases=self.phases)
+
+    def _extract(self, doc_str, parser_class):
+        """Returns the worksheets a parser class reads, extracted without the cache"""
+        return XLSParser().extract_worksheets(doc_str, [tab for tab, name in parser_class.PARSE_TABS],
+                                              columns=parser_class.PARSE_COLUMNS)
+
+    def _parse(self, parser, sheets):
+        """Parses extracted worksheets, so that the parse phase does not include extraction"""
+        xls_parser = XLSParser()
+        parser.parse_records(dict((tab, xls_parser.iter_records(sheet)) for tab, sheet in sheets.iteritems()),
+                             self.filename)
+
+    def _measure(self, phase, func, *args, **kwargs):
+        start = time.time()
+        result = func(*args, **kwargs)
+        self.phases.append(dict(phase=phase, seconds=round(time.time() - start, 3),
+                                peak_mb=get_peak_memory()))
+        return result
+
+
+def run_suite(sizes, label=None, workers=None, data_dir=None, seed=1, l4_per_l3=5, l3_per_l2=4,
+              max_parents=2, num_ms=50, num_tracing=None):
+    """Generates a workbook per size (reusing existing ones generated with the same options)
+    and benchmarks each in a separate process, so that peak memory is measured per size.
+    The other options are passed to generate_workbook. Returns the path of the saved results."""
+    data_dir = data_dir or os.path.join(OUT_BENCH_DIR, "data")
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+    dtstr = datetime.datetime.today().strftime('%Y%m%d_%H%M%S')
+    num_tracing = num_ms * 20 if num_tracing is None else num_tracing
+    gen_options = dict(l4_per_l3=l4_per_l3, l3_per_l2=l3_per_l2, max_parents=max_parents, num_ms=num_ms,
+                       num_tracing=num_tracing, seed=seed)
+    results = dict(label=label or dtstr, date=dtstr, python=platform.python_version(),
+                   platform=platform.platform(), parser_version=PARSER_VERSION,
+                   workers=workers or tracewriter.TRACE_WORKERS, generate=gen_options, runs=[])
+
+    script = os.path.abspath(__file__.replace(".pyc", ".py"))
+    for size in sizes:
+        in_filename = os.path.abspath(os.path.join(data_dir, "synth_%s_%sx%s_p%s_ms%s_t%s_%s.xlsx" % (
+            size, l4_per_l3, l3_per_l2, max_parents, num_ms, num_tracing, seed)))
+        if not os.path.exists(in_filename):
+            print "Generating %s" % in_filename
+            generate_workbook(in_filename, num_l4=size, **gen_options)
+        run_dir = tempfile.mkdtemp(prefix="reqbench")
+        result_filename = os.path.join(run_dir, "result.json")
+        cmd = [sys.executable, script, "run", in_filename, result_filename]
+        if workers:
+            cmd.extend(["--workers", str(workers)])
+        print "Benchmarking %s L4 requirements" % size
+        with open(os.devnull, "w") as devnull:
+            ret = subprocess.call(cmd, cwd=run_dir, stdout=devnull)
+        if ret != 0:
+            print "ERROR: Benchmark of %s failed with exit code %s" % (in_filename, ret)
+            continue
+        with open(result_filename) as f:
+            run = json.load(f)
+        shutil.rmtree(run_dir, ignore_errors=True)
+        run["num_l4"] = size
+        results["runs"].append(run)
+        print_run(run)
+
+    path = os.path.join(OUT_BENCH_DIR, "bench_%s.json" % dtstr)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print "Saved results to %s" % path
+    return path
+
+
+def print_run(run):
+    print " %s: %s nodes, %s links" % (run["filename"], run["num_nodes"], run["num_links"])
+    for phase in run["phases"]:
+        print "  %-14s %9.3fs %12s" % (phase["phase"], phase["seconds"], format_memory(phase["peak_mb"]))
+
+
+def compare_results(filename1, filename2):
+    """Prints the phase times of two saved suite results side by side"""
+    with open(filename1) as f:
+        results1 = json.load(f)
+    with open(filename2) as f:
+        results2 = json.load(f)
+    runs2 = dict((run["num_l4"], run) for run in results2["runs"])
+    print "%-20s %14s %14s %8s" % ("", results1["label"][:14], results2["label"][:14], "ratio")
+    for run1 in results1["runs"]:
+        run2 = runs2.get(run1["num_l4"])
+        if not run2:
+            continue
+        print "%s L4:" % run1["num_l4"]
+        phases2 = dict((phase["phase"], phase) for phase in run2["phases"])
+        for phase1 in run1["phases"]:
+            phase2 = phases2.get(phase1["phase"])
+            if not phase2:
+                continue
+            ratio = phase2["seconds"] / phase1["seconds"] if phase1["seconds"] else 0
+            print "  %-18s %13.3fs %13.3fs %7.2fx" % (phase1["phase"], phase1["seconds"], phase2["seconds"], ratio)
+        print "  %-18s %14s %14s" % ("peak memory", format_memory(run1["phases"][-1]["peak_mb"]),
+                                     format_memory(run2["phases"][-1]["peak_mb"]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Requirements Tools Benchmark")
+    subparsers = parser.add_subparsers(dest="command")
+
+    def add_generate_arguments(subparser):
+        subparser.add_argument("--l4-per-l3", type=int, default=5, help="L4 per L3 requirement (default: %(default)s)")
+        subparser.add_argument("--l3-per-l2", type=int, default=4, help="L3 per L2 requirement (default: %(default)s)")
+        subparser.add_argument("--max-parents", type=int, default=2, help="maximum parent links per requirement (default: %(default)s)")
+        subparser.add_argument("--milestones", type=int, default=50, help="number of milestones (default: %(default)s)")
+        subparser.add_argument("--tracing", type=int, help="number of tracing rows (default: 20 per milestone)")
+        subparser.add_argument("--seed", type=int, default=1, help="random seed (default: %(default)s)")
+
+    gen_parser = subparsers.add_parser("generate", help="write a synthetic requirements export")
+    gen_parser.add_argument("out_filename", help="xlsx file to write")
+    gen_parser.add_argument("--l4", type=int, default=1000, help="number of L4 requirements (default: %(default)s)")
+    add_generate_arguments(gen_parser)
+
+    suite_parser = subparsers.add_parser("suite", help="benchmark synthetic exports of several sizes")
+    suite_parser.add_argument("--sizes", default=",".join(map(str, BENCH_SIZES)),
+                              help="comma separated numbers of L4 requirements (default: %(default)s)")
+    suite_parser.add_argument("--label", help="label of this run in the results, e.g. a version")
+    suite_parser.add_argument("--workers", type=int, help="number of processes writing trace files")
+    add_generate_arguments(suite_parser)
+
+    run_parser = subparsers.add_parser("run", help="benchmark one export")
+    run_parser.add_argument("in_filename", help="requirements export")
+    run_parser.add_argument("result_filename", help="JSON file to write the results to")
+    run_parser.add_argument("--workers", type=int, help="number of processes writing trace files")
+
+    compare_parser = subparsers.add_parser("compare", help="compare two suite results")
+    compare_parser.add_argument("result_filenames", nargs=2, help="JSON result files")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        generate_workbook(args.out_filename, num_l4=args.l4, l4_per_l3=args.l4_per_l3, l3_per_l2=args.l3_per_l2,
+                          max_parents=args.max_parents, num_ms=args.milestones, num_tracing=args.tracing,
+                          seed=args.seed)
+    elif args.command == "suite":
+        run_suite([int(size) for size in args.sizes.split(",")], args.label, args.workers, seed=args.seed,
+                  l4_per_l3=args.l4_per_l3, l3_per_l2=args.l3_per_l2, max_parents=args.max_parents,
+                  num_ms=args.milestones, num_tracing=args.tracing)
+    elif args.command == "run":
+        result = ReqBenchmark(args.in_filename, args.workers).run()
+        with open(args.result_filename, "w") as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+    elif args.command == "compare":
+        compare_results(*args.result_filenames)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+"""Change detection between requirement exports"""
+
+__author__ = 'Michael Meisinger'
+
+import cPickle as pickle
+import os
+
+STATE_VERSION = 2
+
+# ReqNode attributes that make up a requirement's content
+FINGERPRINT_ATTRS = ("req_txt", "desc", "item_type", "group", "req_ms1", "req_ms2", "deliverable", "num_parents")
+
+CHANGE_ADDED = "ADDED"
+CHANGE_REMOVED = "REMOVED"
+CHANGE_CHANGED = "CHANGED"
+CHANGE_LINK_ADDED = "LINK ADDED"
+CHANGE_LINK_REMOVED = "LINK REMOVED"
+
+
+def get_fingerprint(node):
+    return tuple(getattr(node, attr) for attr in FINGERPRINT_ATTRS)
+
+
+class ReqState(object):
+    """Persisted state of an analysis run. Maps (level, req_id) of every node to a
+    tuple (fingerprint, child keys, RollupResult)."""
+
+    def __init__(self, nodes=None):
+        self.nodes = nodes or {}
+
+    @classmethod
+    def from_analysis(cls, graph, rollup):
+        nodes = {}
+        for node in graph.nodes:
+            child_keys = frozenset((graph.nodes[idx].level, graph.nodes[idx].req_id) for idx in rollup.child_ids(node))
+            nodes[(node.level, node.req_id)] = (get_fingerprint(node), child_keys, rollup.get(node))
+        return cls(nodes)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            version, nodes = pickle.load(f)
+        if version != STATE_VERSION:
+            raise ValueError("Unsupported state version %s in %s" % (version, path))
+        return cls(nodes)
+
+    def save(self, path):
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        with open(path, "wb") as f:
+            pickle.dump((STATE_VERSION, self.nodes), f, pickle.HIGHEST_PROTOCOL)
+
+
+class ReqDelta(object):
+    """Differences between a previous run's state and a newly parsed graph.
+
+    Nodes whose content or children changed, and all their ancestors, are dirty.
+    get_known_results returns the previous results for all other nodes, so that
+    only the dirty nodes need to be rolled up again."""
+
+    def __init__(self, prev_state, graph, child_ids):
+        self.prev_state = prev_state
+        self.graph = graph
+        self.child_ids = child_ids
+        self.changes = []
+        self.dirty = set()
+        self._find_changes()
+
+    def get_known_results(self):
+        known = [None] * len(self.graph.nodes)
+        for node in self.graph.nodes:
+            if node.idx not in self.dirty:
+                known[node.idx] = self.prev_state.nodes[(node.level, node.req_id)][2]
+        return known
+
+    def get_transitions(self, rollup, levels):
+        """Returns a list of (level, req_id, old result, new result) for the nodes of the
+        given levels that were added, removed or changed status or addressed flag.
+        Results are None for added and removed nodes."""
+        transitions = []
+        for level in levels:
+            for node in self.graph.get_level(level):
+                new_res = rollup.get(node)
+                prev = self.prev_state.nodes.get((level, node.req_id))
+                old_res = prev[2] if prev else None
+                if not old_res or (old_res.status, old_res.addressed) != (new_res.status, new_res.addressed):
+                    transitions.append((level, node.req_id, old_res, new_res))
+            removed = [key for key in self.prev_state.nodes if key[0] == level and not self.graph.get(*key)]
+            for key in sorted(removed):
+                transitions.append((level, key[1], self.prev_state.nodes[key][2], None))
+        return transitions
+
+    def _find_changes(self):
+        graph = self.graph
+        nodes = graph.nodes
+        prev_nodes = self.prev_state.nodes
+        parent_ids = {}
+        for node in nodes:
+            child_ids = self.child_ids(node)
+            for idx in child_ids:
+                parent_ids.setdefault(idx, []).append(node.idx)
+            key = (node.level, node.req_id)
+            prev = prev_nodes.get(key)
+            if prev is None:
+                self.changes.append((node.level, node.req_id, CHANGE_ADDED, ""))
+                self.dirty.add(node.idx)
+                continue
+            prev_fingerprint, prev_child_keys, prev_res = prev
+            fingerprint = get_fingerprint(node)
+            if fingerprint != prev_fingerprint:
+                changed_attrs = [attr for attr, old, new in zip(FINGERPRINT_ATTRS, prev_fingerprint, fingerprint) if old != new]
+                self.changes.append((node.level, node.req_id, CHANGE_CHANGED, ", ".join(changed_attrs)))
+                self.dirty.add(node.idx)
+            child_keys = frozenset((nodes[idx].level, nodes[idx].req_id) for idx in child_ids)
+            if child_keys != prev_child_keys:
+                for child_key in sorted(child_keys - prev_child_keys):
+                    self.changes.append((node.level, node.req_id, CHANGE_LINK_ADDED, child_key[1]))
+                for child_key in sorted(prev_child_keys - child_keys):
+                    self.changes.append((node.level, node.req_id, CHANGE_LINK_REMOVED, child_key[1]))
+                self.dirty.add(node.idx)
+        for key in sorted(prev_nodes):
+            if not graph.get(*key):
+                self.changes.append((key[0], key[1], CHANGE_REMOVED, ""))
+
+        # Status changes propagate to all ancestors
+        stack = list(self.dirty)
+        while stack:
+            for idx in parent_ids.get(stack.pop(), ()):
+                if idx not in self.dirty:
+                    self.dirty.add(idx)
+                    stack.append(idx)
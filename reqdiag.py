@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+"""Collection of diagnostics found while parsing requirements"""
+
+__author__ = 'Michael Meisinger'
+
+import csv
+import os
+
+DIAG_DUPLICATE_ID = "DUPLICATE ID"
+DIAG_MISSING_TARGET = "MISSING LINK TARGET"
+DIAG_DUPLICATE_LINK = "DUPLICATE LINK"
+
+DIAG_HEADER = ["Type", "Tab", "Row", "Source", "Target", "Occurrences"]
+
+
+class ReqDiagnostics(object):
+    """Collects diagnostics such as duplicate IDs and broken links without any output.
+
+    A diagnostic is identified by its type, tab, source and target. Repeated ones are
+    kept once with the sheet row of their first occurrence and a count of occurrences."""
+
+    def __init__(self):
+        self._diags = {}
+        self._order = []
+
+    def add(self, diag_type, tab, row, source, target="", occurrences=1):
+        key = (diag_type, tab, source, target)
+        diag = self._diags.get(key)
+        if diag is None:
+            self._diags[key] = [row, occurrences]
+            self._order.append(key)
+        else:
+            diag[1] += occurrences
+
+    def add_rows(self, rows):
+        """Adds diagnostics given as rows of DIAG_HEADER values, as from get_rows"""
+        for diag_type, tab, row, source, target, occurrences in rows:
+            self.add(diag_type, tab, row, source, target, occurrences)
+
+    def __len__(self):
+        return len(self._order)
+
+    def get_rows(self):
+        """Returns rows of DIAG_HEADER values in order of first occurrence"""
+        rows = []
+        for key in self._order:
+            diag_type, tab, source, target = key
+            row, occurrences = self._diags[key]
+            rows.append([diag_type, tab, row, source, target, occurrences])
+        return rows
+
+    def get_counts(self):
+        """Returns dict of diagnostic type to number of distinct diagnostics"""
+        counts = {}
+        for key in self._order:
+            counts[key[0]] = counts.get(key[0], 0) + 1
+        return counts
+
+    def get_summary(self):
+        counts = self.get_counts()
+        return ", ".join("%s %s" % (counts[diag_type], diag_type) for diag_type in sorted(counts))
+
+    def write_sheet(self, writer, name="Diagnostics"):
+        """Adds a sheet with all diagnostics to a report writer"""
+        ws = writer.add_sheet(name, DIAG_HEADER)
+        for row in self.get_rows():
+            ws.append(row)
+
+    def save_csv(self, path):
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        with open(path, "wb") as f:
+            csv_writer = csv.writer(f)
+            csv_writer.writerow(DIAG_HEADER)
+            csv_writer.writerows(self.get_rows())
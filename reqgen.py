@@ -2,128 +2,99 @@
 
 """Requirements Tracing Generator.
 
-USAGE: python reqgen.py <in_filename> <out_filename>
+USAGE: python reqgen.py [--stream] [--no-cache] [--workers <n>] [--metrics <file>] [--profile <file>]
+       <in_filename> <out_filename>
 
 Prerequisites: xtwt, xlrd in virtualenv
 """
 
 __author__ = 'Michael Meisinger'
 
-import csv
-import datetime
-import os
+import argparse
 import sys
-import xlwt
-from xlsparser import XLSParser
+from outmanifest import OutputManifest
+from reqgraph import normalize_text
+from reqmetrics import profiled
+from reqsource import ReqParser, InputError
+import tracewriter
 
 REQ_FILE = "Deliverabe-Milestone-Requirement_Mapping_V02.xlsx"
 OUT_FILE_PREFIX = "output/reqanalysis"
-OUT_TRACE_PREFIX = "output/tracing"
+OUT_TRACE_PREFIX = "output/deliverables"
+OUT_MANIFEST = "output/manifest_reqgen.json"
 
-TAB_TRACING = "Example v2"
-
-HTABLE_START = """
-<div class="panel" style="border-width: 1px;">
-  <div class="panelContent">
-    <h3>%%TITLE%%</h3>
-    <div class='table-wrap'>
-      <table class='confluenceTable'>"""
+# Metrics phase of the deliverable trace pages, summed up with the requirement trace pages
+TRACE_PHASE = "trace:deliverables"
 
-HTABLE_END = """
-      </table>
-    </div>
-  </div>
-</div>"""
+TAB_TRACING = "Example v2"
 
-HTABLE_ROW_START = """
-        <tr>"""
+# Tabs to load from the workbook and the _parse_<name> handler for each
+PARSE_TABS = [
+    (TAB_TRACING, "tracing"),
+]
 
-HTABLE_ROW_END = """
-        </tr>"""
+# Columns read by the _parse_<name> handlers, by tab. No other cells are extracted.
+PARSE_COLUMNS = {
+    TAB_TRACING: ["Sort ID", "Activated", "Subject Domain", "Subject ID", "Subject Title", "Relationship",
+                  "Object Title", "Sub-Relationship", "Subobject Title", "Description"],
+}
 
-HTABLE_HEAD_ROW = """
-          <th class='confluenceTh'>%%TEXT%%</th>"""
 
-HTABLE_ROW = """
-          <td class='confluenceTd'>%%TEXT%%</td>"""
+class ReqAnalysis(ReqParser):
+    PARSE_TABS = PARSE_TABS
+    PARSE_COLUMNS = PARSE_COLUMNS
 
-HTABLE_SEP = """
-<p>
-  <br class="atl-forced-newline" />
-</p>"""
+    def __init__(self, metrics=None):
+        ReqParser.__init__(self, metrics)
+        self.req = {}
 
+    def end_parse(self):
+        self.metrics.counters.update(milestones=len(self.req), items=sum(len(ms_list) for ms_list in self.req.itervalues()))
 
-class ReqAnalysis(object):
-    def __init__(self):
-        self.req = {}
+    def dump_trace_files(self, workers=None, manifest=None):
+        """Writes a trace page per milestone. Unchanged pages are not rewritten. Given an
+        OutputManifest, pages of milestones that no longer exist are removed."""
+        with self.metrics.phase(TRACE_PHASE) as counters:
+            removed = len(manifest.removed) if manifest else 0
+            counters["pages"], counters["written"] = self._dump_trace_files(workers, manifest)
+            counters["removed"] = len(manifest.removed) - removed if manifest else 0
 
-    def parse(self, filename):
-        # Load from load xlsx file
-        if os.path.exists(filename):
-            with open(filename, "rb") as f:
-                print "Opened", filename
-                doc_str = f.read()
-                print "Read req file, size=%s" % len(doc_str)
-                xls_parser = XLSParser()
-                self.csv_files = xls_parser.extract_csvs(doc_str)
-                print "Parsed req file OK. Found %s tabs." % len(self.csv_files)
-        else:
-            print "ERROR: Requirements file %s does not exist" % filename
-            sys.exit(1)
-
-        PARSE_TABS = [
-            (TAB_TRACING, "tracing"),
-        ]
-        for tab, name in PARSE_TABS:
-            tab_rows = self.csv_files[tab]
-            parse_func_name = "_parse_%s" % name
-            if hasattr(self, parse_func_name):
-                parse_func = getattr(self, parse_func_name)
-                reader = csv.DictReader(tab_rows, delimiter=',')
-                print "Parsing tab", tab
-                self._lnum = 0
-                self._add_cnt = 0
-                for row in reader:
-                    res = parse_func(row)
-                    self._lnum += 1
-                    if res:
-                        self._add_cnt += 1
-                print " ...using %s of %s rows" % (self._add_cnt, self._lnum)
-
-    def dump_trace_files(self):
+    def _dump_trace_files(self, workers, manifest):
+        pages = []
         for ms_id in sorted(self.req):
             ms_list = self.req[ms_id]
-
-            if not os.path.exists(OUT_TRACE_PREFIX):
-                os.makedirs(OUT_TRACE_PREFIX)
-
-            ms_filename = "%s/%s.html" % (OUT_TRACE_PREFIX, ms_id)
-            with open(ms_filename, "w") as f:
-                ms_item = ms_list[0]
-                f.write(HTABLE_START.replace("%%TITLE%%", "Requirements for %s (%s)" % (ms_id, ms_item["subject"])))
-                f.write(HTABLE_ROW_START)
-                f.write(HTABLE_HEAD_ROW.replace("%%TEXT%%", "Relationship"))
-                f.write(HTABLE_HEAD_ROW.replace("%%TEXT%%", "Object"))
-                f.write(HTABLE_HEAD_ROW.replace("%%TEXT%%", "Sub-Relationship"))
-                f.write(HTABLE_HEAD_ROW.replace("%%TEXT%%", "Sub-Object"))
-                f.write(HTABLE_HEAD_ROW.replace("%%TEXT%%", "Description"))
-                f.write(HTABLE_ROW_END)
-
-                for item in ms_list[1:]:
-                    f.write(HTABLE_ROW_START)
-                    f.write(HTABLE_ROW.replace("%%TEXT%%", item["rel1"]))
-                    f.write(HTABLE_ROW.replace("%%TEXT%%", item["object"]))
-                    f.write(HTABLE_ROW.replace("%%TEXT%%", item["rel2"]))
-                    f.write(HTABLE_ROW.replace("%%TEXT%%", item["subobj"]))
-                    f.write(HTABLE_ROW.replace("%%TEXT%%", item["desc"]))
-                    f.write(HTABLE_ROW_END)
-
-                f.write(HTABLE_END)
-
-    def do_all(self, in_filename=None, out_filename=None):
-        self.parse(in_filename or REQ_FILE)
-
-        self.dump_trace_files()
+            ms_item = ms_list[0]
+            rows = [(item["rel1"], item["object"], item["rel2"], item["subobj"], item["desc"]) for item in ms_list[1:]]
+            pages.append(("%s/%s.html" % (OUT_TRACE_PREFIX, ms_id),
+                          "Requirements for %s (%s)" % (ms_id, ms_item["subject"]),
+                          ["Relationship", "Object", "Sub-Relationship", "Sub-Object", "Description"],
+                          rows))
+
+        written = tracewriter.write_pages(pages, OUT_TRACE_PREFIX, workers, manifest)
+        return len(pages), written
+
+    def do_all(self, in_filename=None, out_filename=None, use_cache=True, streaming=False, workers=None,
+               metrics_filename=None, profile_filename=None):
+        in_filename = in_filename or REQ_FILE
+        with profiled(profile_filename):
+            self.parse(in_filename, use_cache=use_cache, streaming=streaming)
+
+            manifest = OutputManifest(OUT_MANIFEST)
+            self.dump_trace_files(workers, manifest)
+            manifest.save()
+
+        self.print_summary(in_filename)
+        print " " + self.metrics.get_summary()
+        if metrics_filename:
+            self.metrics.save(metrics_filename)
+
+    def print_summary(self, in_filename):
+        counters = self.metrics.counters
+        print "Traced %s: %s milestones, %s items" % (in_filename, counters["milestones"], counters["items"])
+        trace_counters = self.metrics.get_phase_counters(TRACE_PHASE)
+        if trace_counters:
+            print " Wrote %s of %s deliverable trace pages, removed %s" % (
+                trace_counters["written"], trace_counters["pages"], trace_counters["removed"])
 
     # -------------------------------------------------------------------------
 
@@ -150,12 +121,12 @@ class ReqAnalysis(object):
         ms_dict = dict(
             ms_id=ms_id,
             item_id=item_id,
-            subject=row["Subject Title"],
-            rel1=row["Relationship"],
-            object=row["Object Title"],
-            rel2=row["Sub-Relationship"],
-            subobj=row["Subobject Title"],
-            desc=row["Description"],
+            subject=normalize_text(row["Subject Title"]),
+            rel1=normalize_text(row["Relationship"]),
+            object=normalize_text(row["Object Title"]),
+            rel2=normalize_text(row["Sub-Relationship"]),
+            subobj=normalize_text(row["Subobject Title"]),
+            desc=normalize_text(row["Description"]),
             order=self._lnum
         )
         self._add_req(ms_id, item_id, ms_dict)
@@ -163,8 +134,22 @@ class ReqAnalysis(object):
 
 
 if __name__ == '__main__':
-    in_filename = sys.argv[1] if len(sys.argv) >= 2 else None
-    out_filename = sys.argv[2] if len(sys.argv) >= 3 else None
+    parser = argparse.ArgumentParser(description="Requirements Tracing Generator")
+    parser.add_argument("in_filename", nargs="?",
+                        help="requirements xlsx file or directory of per-tab CSV/TSV files (default: %s)" % REQ_FILE)
+    parser.add_argument("out_filename", nargs="?", help="output file name")
+    parser.add_argument("--stream", action="store_true", help="stream xlsx rows instead of loading the workbook")
+    parser.add_argument("--no-cache", action="store_true", help="do not use the extracted worksheet cache")
+    parser.add_argument("--workers", type=int, default=tracewriter.TRACE_WORKERS,
+                        help="number of processes writing trace files (default: %(default)s)")
+    parser.add_argument("--metrics", help="JSON file to write phase times, counts and peak memory to")
+    parser.add_argument("--profile", help="file to write cProfile stats of the run to")
+    args = parser.parse_args()
 
     ra = ReqAnalysis()
-    ra.do_all(in_filename, out_filename)
+    try:
+        ra.do_all(args.in_filename, args.out_filename, use_cache=not args.no_cache, streaming=args.stream,
+                  workers=args.workers, metrics_filename=args.metrics, profile_filename=args.profile)
+    except InputError as ex:
+        print "ERROR: %s" % ex
+        sys.exit(1)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+"""Requirement graph model"""
+
+__author__ = 'Michael Meisinger'
+
+import array
+import unicodedata
+
+# ReqNode attributes holding text. They are normalized once when set through add_node.
+TEXT_ATTRS = ("req_txt", "desc")
+
+
+def normalize_text(value):
+    """Returns value as NFC normalized unicode with \\n line ends. str values are
+    decoded as utf-8, the encoding of parsed rows."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.decode("utf-8", "replace")
+    elif not isinstance(value, unicode):
+        value = unicode(value)
+    return unicodedata.normalize("NFC", value.replace(u"\r\n", u"\n").replace(u"\r", u"\n"))
+
+
+class ReqNode(object):
+    """A requirement or milestone. idx is the node's dense integer ID in its graph.
+    For milestones, req_txt holds the milestone name. Text attributes are unicode."""
+
+    __slots__ = ("idx", "level", "req_id", "req_txt", "desc", "item_type", "group",
+                 "req_ms1", "req_ms2", "deliverable", "num_parents", "order", "_encoded")
+
+    def __init__(self, idx, level, req_id):
+        self.idx = idx
+        self.level = level
+        self.req_id = req_id
+        for attr in ReqNode.__slots__[3:]:
+            setattr(self, attr, None)
+
+    def __repr__(self):
+        return "ReqNode(%s, %s)" % (self.level, self.req_id)
+
+    def encoded(self, attr, encoding):
+        """Returns a text attribute encoded for an output. encoding is a codec name
+        (characters it cannot represent are replaced) or a function of the text, such as
+        a report writer's text_encoder. Each encoding is computed once per node."""
+        if self._encoded is None:
+            self._encoded = {}
+        key = (attr, encoding)
+        value = self._encoded.get(key)
+        if value is None:
+            text = getattr(self, attr) or u""
+            value = encoding(text) if callable(encoding) else text.encode(encoding, "replace")
+            self._encoded[key] = value
+        return value
+
+
+class ReqGraph(object):
+    """Requirements of all levels with the links between them.
+
+    Requirement IDs are interned per level and mapped to dense integer node IDs,
+    assigned in the order requirements are first added. Links point from a parent
+    (e.g. an L3) to a child (e.g. an L4 that refines it). Child sets are kept per
+    parent for O(1) duplicate checks, parents as compact int arrays per child."""
+
+    def __init__(self):
+        self.nodes = []
+        self._ids = {}
+        self._down = []
+        self._up = []
+        self.num_links = 0
+
+    def add_node(self, level, req_id, **attrs):
+        """Adds the requirement or updates the existing one with the same level and ID"""
+        level_ids = self._ids.get(level)
+        if level_ids is None:
+            level_ids = self._ids[level] = {}
+        idx = level_ids.get(req_id)
+        if idx is None:
+            idx = level_ids[req_id] = len(self.nodes)
+            self.nodes.append(ReqNode(idx, level, req_id))
+            self._down.append(None)
+            self._up.append(None)
+        node = self.nodes[idx]
+        for attr, value in attrs.iteritems():
+            if attr in TEXT_ATTRS:
+                value = normalize_text(value)
+            setattr(node, attr, value)
+        node._encoded = None
+        return node
+
+    def get(self, level, req_id):
+        idx = self._ids.get(level, {}).get(req_id)
+        return self.nodes[idx] if idx is not None else None
+
+    def get_level(self, level):
+        """Returns the nodes of a level in order"""
+        level_nodes = [self.nodes[idx] for idx in self._ids.get(level, {}).itervalues()]
+        level_nodes.sort(key=lambda node: node.order)
+        return level_nodes
+
+    def level_size(self, level):
+        return len(self._ids.get(level, {}))
+
+    def add_link(self, parent, child):
+        """Links child to parent. Returns False if the link was already present"""
+        children = self._down[parent.idx]
+        if children is None:
+            children = self._down[parent.idx] = set()
+        elif child.idx in children:
+            return False
+        children.add(child.idx)
+        parents = self._up[child.idx]
+        if parents is None:
+            parents = self._up[child.idx] = array.array("i")
+        parents.append(parent.idx)
+        self.num_links += 1
+        return True
+
+    def child_ids(self, node):
+        """Returns the node IDs of the children of a node, in the order added to the graph"""
+        children = self._down[node.idx]
+        return sorted(children) if children else []
+
+    def parent_ids(self, node):
+        parents = self._up[node.idx]
+        return sorted(parents) if parents else []
+
+    def children(self, node):
+        return [self.nodes[idx] for idx in self.child_ids(node)]
+
+    def parents(self, node):
+        return [self.nodes[idx] for idx in self.parent_ids(node)]
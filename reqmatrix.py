@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+
+"""Coverage status rollup with sparse link matrices.
+
+Computes the same results as StatusRollup with a few sparse matrix products per level,
+for many what-if scenarios of leaf statuses at once. Requires numpy and scipy.
+
+USAGE: python reqmatrix.py [--stream] [--no-cache] <in_filename> <scenario_csv>
+
+The scenario CSV has the columns Scenario, ID and Group and reassigns the Group of L4
+requirements per scenario. Prints the L2 and L3 status counts of each scenario.
+"""
+
+__author__ = 'Michael Meisinger'
+
+import argparse
+import csv
+import sys
+
+try:
+    import numpy as np
+    import scipy.sparse as sparse
+except ImportError:
+    np = sparse = None
+
+from reqrollup import RollupResult, STATUS_VERIFIED, STATUS_R3, STATUS_R4, STATUS_OUT, STATUS_PARTIAL, \
+    STATUS_OTHER, STATUS_MISSING, ADDRESSED, NOT_ADDRESSED, ADDRESSED_STATUSES
+
+# Codes of the addressed flag in the addressed matrix
+ADDRESSED_FLAGS = ["", NOT_ADDRESSED, ADDRESSED]
+FLAG_NONE, FLAG_NOT_ADDRESSED, FLAG_ADDRESSED = range(3)
+
+
+class MatrixRollup(object):
+    """Computes the status of every node of a ReqGraph for one or more scenarios.
+
+    Takes the same arguments as StatusRollup. Statuses are encoded as integer codes
+    into a nodes x scenarios matrix. For each rolled up level, the links to its children
+    form a sparse matrix, and the children by status are counted with one product per
+    status with the one-hot child status matrix. Statuses, addressed flags and percents
+    follow from these counts elementwise. get returns RollupResults as StatusRollup does."""
+
+    def __init__(self, graph, levels, leaf_status, child_ids=None):
+        if np is None:
+            raise ImportError("numpy and scipy are required for the matrix rollup")
+        self.graph = graph
+        self.levels = levels
+        self.leaf_status = leaf_status
+        self.child_ids = child_ids or graph.child_ids
+        self.statuses = []
+        self._status_codes = {}
+        self.num_scenarios = 0
+        self._results = None
+
+    def compute(self, scenarios=None):
+        """Computes the results of all nodes. scenarios is a list of dicts mapping leaf
+        node IDs to a leaf status that replaces the node's own. Each scenario gives one
+        column of results. By default, there is one scenario without changes."""
+        scenarios = scenarios or [{}]
+        graph = self.graph
+        nodes = graph.nodes
+        num_nodes, num_scenarios = len(nodes), len(scenarios)
+        self.num_scenarios = num_scenarios
+        self._results = None
+
+        for status in (STATUS_VERIFIED, STATUS_R3, STATUS_R4, STATUS_OUT, STATUS_PARTIAL, STATUS_OTHER, ""):
+            self._get_code(status)
+        self.codes = np.full((num_nodes, num_scenarios), -1, dtype=np.int32)
+        self.flags = np.zeros((num_nodes, num_scenarios), dtype=np.int8)
+
+        # Leaves, with their status changed per scenario
+        level_rows = {}
+        for node in nodes:
+            level_rows.setdefault(node.level, []).append(node.idx)
+            if node.level not in self.levels:
+                self.codes[node.idx] = self._get_code(self.leaf_status(node))
+        for col, scenario in enumerate(scenarios):
+            for idx, status in scenario.iteritems():
+                self.codes[idx, col] = self._get_code(status)
+        addressed_codes = [self._status_codes[status] for status in ADDRESSED_STATUSES]
+        is_leaf = np.ones(num_nodes, dtype=bool)
+        for level in self.levels:
+            is_leaf[level_rows.get(level, [])] = False
+        self.flags[is_leaf] = np.where(np.isin(self.codes[is_leaf], addressed_codes), FLAG_ADDRESSED, FLAG_NOT_ADDRESSED)
+
+        # Links from rolled up nodes to their children, one row per node
+        parents, children = [], []
+        for level in self.levels:
+            for idx in level_rows.get(level, []):
+                child_ids = self.child_ids(nodes[idx])
+                parents.extend([idx] * len(child_ids))
+                children.extend(child_ids)
+        links = sparse.csr_matrix((np.ones(len(parents), dtype=np.int32), (parents, children)),
+                                  shape=(num_nodes, num_nodes))
+
+        self.level_rows = {}
+        self.level_counts = {}
+        for level in self._get_level_order(level_rows, links):
+            rows = np.array(level_rows.get(level, []), dtype=np.int64)
+            self.level_rows[level] = rows
+            self._rollup_level(level, rows, links[rows])
+        return self
+
+    def get(self, node, scenario=0):
+        if scenario == 0:
+            if self._results is None:
+                self._results = [None] * len(self.graph.nodes)
+            res = self._results[node.idx]
+            if res is None:
+                res = self._results[node.idx] = self._get_result(node, 0)
+            return res
+        return self._get_result(node, scenario)
+
+    @property
+    def results(self):
+        return [self.get(node) for node in self.graph.nodes]
+
+    def get_level_counts(self, level):
+        """Returns a dict of status to an array with the number of nodes of the level with
+        that status per scenario, plus the number addressed under ADDRESSED"""
+        rows = self.level_rows.get(level)
+        if rows is None:
+            rows = np.array([node.idx for node in self.graph.get_level(level)], dtype=np.int64)
+        codes = self.codes[rows]
+        counts = {}
+        for code, status in enumerate(self.statuses):
+            status_counts = (codes == code).sum(axis=0)
+            if status_counts.any():
+                counts[status] = status_counts
+        counts[ADDRESSED] = (self.flags[rows] == FLAG_ADDRESSED).sum(axis=0)
+        return counts
+
+    def _get_code(self, status):
+        code = self._status_codes.get(status)
+        if code is None:
+            code = self._status_codes[status] = len(self.statuses)
+            self.statuses.append(status)
+        return code
+
+    def _get_level_order(self, level_rows, links):
+        """Returns the rolled up levels ordered so that each level's children are leaves
+        or of a level before it"""
+        nodes = self.graph.nodes
+        child_levels = {}
+        for level in self.levels:
+            rows = level_rows.get(level, [])
+            child_idxs = np.unique(links[rows].indices) if rows else []
+            child_levels[level] = set(nodes[idx].level for idx in child_idxs) & set(self.levels)
+            child_levels[level].discard(level)
+        order = []
+        while len(order) < len(self.levels):
+            ready = [level for level in sorted(self.levels) if level not in order and child_levels[level] <= set(order)]
+            if not ready:
+                raise ValueError("Cyclic links between levels %s" % sorted(set(self.levels) - set(order)))
+            order.extend(ready)
+        return order
+
+    def _rollup_level(self, level, rows, level_links):
+        nodes = self.graph.nodes
+        num_rows = len(rows)
+        child_codes = self.codes
+        child_flags = self.flags
+
+        # Children by status: one sparse product per status present
+        counts = {}
+        child_status_codes = np.unique(child_codes[level_links.indices]) if level_links.nnz else []
+        for code in child_status_codes:
+            counts[int(code)] = level_links.dot((child_codes == code).astype(np.int32))
+        zero = np.zeros((num_rows, self.num_scenarios), dtype=np.int32)
+        count = sum(counts.values(), zero.copy())
+        cnt_ver, cnt_r3, cnt_r4, cnt_out = [counts.get(self._status_codes[status], zero)
+                                            for status in (STATUS_VERIFIED, STATUS_R3, STATUS_R4, STATUS_OUT)]
+        num_other = count - cnt_ver - cnt_r3 - cnt_r4 - cnt_out
+        num_addressed = level_links.dot((child_flags == FLAG_ADDRESSED).astype(np.int32))
+        num_not_addressed = level_links.dot((child_flags == FLAG_NOT_ADDRESSED).astype(np.int32))
+
+        has_shall = np.array([" shall " in nodes[idx].req_txt for idx in rows], dtype=bool)[:, np.newaxis]
+        code = self._get_code
+        status_codes = np.select(
+            [(count == 0) & has_shall,
+             count == 0,
+             count == cnt_ver,
+             count == cnt_ver + cnt_r3,
+             count == cnt_ver + cnt_r3 + cnt_r4,
+             count == cnt_out + num_other,
+             (cnt_ver > 0) | (cnt_r3 > 0)],
+            [code(STATUS_MISSING % self.levels[level]),
+             code(""),
+             code(STATUS_VERIFIED),
+             code(STATUS_R3),
+             code(STATUS_R4),
+             code(STATUS_OUT),
+             code(STATUS_PARTIAL)],
+            code(STATUS_OTHER))
+        self.codes[rows] = status_codes
+        self.flags[rows] = np.where(num_addressed > 0, FLAG_ADDRESSED,
+                                    np.where(status_codes == code(""), FLAG_NONE, FLAG_NOT_ADDRESSED))
+
+        percent = np.where(count > 0, 100 * (cnt_ver + cnt_r3) // np.maximum(count, 1), -1)
+        self.level_counts[level] = dict(counts=counts, count=count, num_other=num_other, num_addressed=num_addressed,
+                                        num_not_addressed=num_not_addressed, percent=percent,
+                                        positions=dict((idx, pos) for pos, idx in enumerate(rows)))
+
+    def _get_result(self, node, scenario):
+        idx = node.idx
+        res = RollupResult(self.statuses[self.codes[idx, scenario]], ADDRESSED_FLAGS[self.flags[idx, scenario]])
+        level_counts = self.level_counts.get(node.level)
+        if level_counts is None:
+            return res
+        pos = level_counts["positions"][idx]
+        res.count = int(level_counts["count"][pos, scenario])
+        res.counts = {}
+        for code, code_counts in level_counts["counts"].iteritems():
+            if code_counts[pos, scenario]:
+                res.counts[self.statuses[code]] = int(code_counts[pos, scenario])
+        res.num_other = int(level_counts["num_other"][pos, scenario])
+        res.num_addressed = int(level_counts["num_addressed"][pos, scenario])
+        res.num_not_addressed = int(level_counts["num_not_addressed"][pos, scenario])
+        percent = int(level_counts["percent"][pos, scenario])
+        res.percent = percent if percent >= 0 else None
+        return res
+
+
+def read_scenarios(filename):
+    """Returns (scenario names, list of dicts of L4 ID to group) from a CSV file with the
+    columns Scenario, ID and Group"""
+    names, scenarios = [], {}
+    with open(filename, "rb") as f:
+        for row in csv.DictReader(f):
+            name = row["Scenario"]
+            if name not in scenarios:
+                names.append(name)
+                scenarios[name] = {}
+            scenarios[name][row["ID"]] = row["Group"]
+    return names, [scenarios[name] for name in names]
+
+
+if __name__ == '__main__':
+    from reqanalysis import ReqAnalysis, TAB_L2, TAB_L3, LEVEL_LABELS
+    from reqsource import InputError
+
+    parser = argparse.ArgumentParser(description="Requirements What-If Scenarios")
+    parser.add_argument("in_filename", help="requirements xlsx file or directory of per-tab CSV/TSV files")
+    parser.add_argument("scenario_filename", help="CSV file with columns Scenario, ID, Group")
+    parser.add_argument("--stream", action="store_true", help="stream xlsx rows instead of loading the workbook")
+    parser.add_argument("--no-cache", action="store_true", help="do not use the extracted worksheet cache")
+    args = parser.parse_args()
+
+    ra = ReqAnalysis()
+    try:
+        ra.parse(args.in_filename, use_cache=not args.no_cache, streaming=args.stream)
+    except InputError as ex:
+        print "ERROR: %s" % ex
+        sys.exit(1)
+    names, scenarios = read_scenarios(args.scenario_filename)
+    names.insert(0, "Current")
+    scenarios.insert(0, {})
+    rollup = ra.evaluate_scenarios(scenarios)
+    for level in (TAB_L2, TAB_L3):
+        counts = rollup.get_level_counts(level)
+        statuses = sorted(status for status in counts if status != ADDRESSED) + [ADDRESSED]
+        print "%s\t%s" % (LEVEL_LABELS[level], "\t".join(status or "(none)" for status in statuses))
+        for col, name in enumerate(names):
+            print "%s\t%s" % (name, "\t".join(str(counts[status][col]) for status in statuses))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+"""Phase timing and run metrics"""
+
+__author__ = 'Michael Meisinger'
+
+import contextlib
+import cProfile
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def get_peak_memory():
+    """Returns the peak resident memory of this process so far in MB, or None where
+    it is not available (no resource module, e.g. on Windows)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, OS X bytes
+    return round(peak / (1024.0 * 1024 if sys.platform == "darwin" else 1024.0), 1)
+
+
+def format_memory(peak_mb, fmt="%.1f MB"):
+    """Returns peak memory as from get_peak_memory formatted, or n/a if not available"""
+    return fmt % peak_mb if peak_mb is not None else "n/a"
+
+
+class RunMetrics(object):
+    """Metrics of one run: wall time and peak memory per phase, plus named counters.
+
+    Peak memory of a phase is the process high-water mark at the end of the phase.
+    Counters given to a phase are stored with it, others with the run."""
+
+    def __init__(self):
+        self.phases = []
+        self.counters = {}
+        self._start = time.time()
+
+    @contextlib.contextmanager
+    def phase(self, name, **counters):
+        """Context manager timing the enclosed code as phase name. Yields the phase's
+        counter dict, to be updated within the phase."""
+        phase = dict(phase=name, counters=dict(counters))
+        start = time.time()
+        try:
+            yield phase["counters"]
+        finally:
+            phase["seconds"] = round(time.time() - start, 3)
+            phase["peak_mb"] = get_peak_memory()
+            self.phases.append(phase)
+
+    def get_phase_counters(self, name):
+        """Returns the counters of the last phase with the given name"""
+        for phase in reversed(self.phases):
+            if phase["phase"] == name:
+                return phase["counters"]
+        return {}
+
+    def to_dict(self):
+        return dict(phases=self.phases, counters=self.counters,
+                    seconds=round(time.time() - self._start, 3), peak_mb=get_peak_memory())
+
+    def save(self, path):
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+
+    def get_summary(self):
+        """Returns a one line summary of phase times and peak memory. Phases with a
+        common prefix before a colon (e.g. parse:L4) are summed up."""
+        times, names = {}, []
+        for phase in self.phases:
+            name = phase["phase"].split(":")[0]
+            if name not in times:
+                names.append(name)
+                times[name] = 0
+            times[name] += phase["seconds"]
+        parts = ["%s %.2fs" % (name, times[name]) for name in names]
+        parts.append("peak %s" % format_memory(get_peak_memory(), "%.0f MB"))
+        return ", ".join(parts)
+
+
+@contextlib.contextmanager
+def profiled(filename):
+    """Context manager running the enclosed code under cProfile, dumping the stats to
+    filename (for pstats or a viewer). Does nothing if filename is None."""
+    if not filename:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        dirname = os.path.dirname(filename)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        profiler.dump_stats(filename)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+"""Requirements Report Pipeline.
+
+Reads a requirements export once and runs the selected reports off the parsed model:
+coverage (analysis report of reqanalysis), traces (requirement trace pages per milestone
+of reqanalysis) and deliverables (deliverable trace pages per milestone of reqgen).
+
+USAGE: python reqpipeline.py [--reports <name,...>] [--stream] [--no-cache] [--workers <n>]
+       [--trend-dir <dir>] [--no-trend] [--metrics <file>] [--profile <file>] <in_filename> [<out_filename>]
+"""
+
+__author__ = 'Michael Meisinger'
+
+import argparse
+import sys
+
+from outmanifest import OutputManifest
+from reqmetrics import RunMetrics, profiled
+from reqsource import check_input, get_source, InputError
+from reqtrend import TrendStore, TREND_DIR
+import reqanalysis
+import reqgen
+import tracewriter
+
+
+def run_coverage(pipeline, ra):
+    ra.analyze()
+    ra.dump_analysis(pipeline.out_filename, pipeline.get_manifest(reqanalysis.OUT_MANIFEST),
+                     TrendStore(pipeline.trend_dir) if pipeline.use_trend else None)
+
+
+def run_traces(pipeline, ra):
+    ra.dump_trace_files(pipeline.workers, pipeline.get_manifest(reqanalysis.OUT_MANIFEST))
+
+
+def run_deliverables(pipeline, rg):
+    rg.dump_trace_files(pipeline.workers, pipeline.get_manifest(reqgen.OUT_MANIFEST))
+
+
+# Report stages in order of execution: name, class of the parser the report is made from,
+# and the function running the report stage with the pipeline and the parser
+REPORT_STAGES = [
+    ("coverage", reqanalysis.ReqAnalysis, run_coverage),
+    ("traces", reqanalysis.ReqAnalysis, run_traces),
+    ("deliverables", reqgen.ReqAnalysis, run_deliverables),
+]
+REPORTS = [name for name, parser_class, stage in REPORT_STAGES]
+
+
+class ReqPipeline(object):
+    """Runs report stages off one parse of an export. Each parser needed by the selected
+    reports is created once and fed the tabs it reads; all tabs are read from the input
+    in a single pass. Phases of all parsers and stages are recorded in one RunMetrics."""
+
+    def __init__(self, reports=None, out_filename=None, workers=None, trend_dir=None, use_trend=True):
+        self.reports = reports or REPORTS
+        for name in self.reports:
+            if name not in REPORTS:
+                raise ValueError("Unknown report %s, expected one of %s" % (name, ", ".join(REPORTS)))
+        self.out_filename = out_filename
+        self.workers = workers
+        self.trend_dir = trend_dir
+        self.use_trend = use_trend
+        self.metrics = RunMetrics()
+        self.parsers = []
+        for name, parser_class, stage in REPORT_STAGES:
+            if name in self.reports and not self.get_parser(parser_class):
+                self.parsers.append(parser_class(self.metrics))
+        self.manifests = {}
+
+    def get_parser(self, parser_class):
+        for parser in self.parsers:
+            if isinstance(parser, parser_class):
+                return parser
+        return None
+
+    def get_manifest(self, path):
+        """Returns the OutputManifest at path, shared by the stages writing to it"""
+        if path not in self.manifests:
+            self.manifests[path] = OutputManifest(path)
+        return self.manifests[path]
+
+    def parse(self, filename, use_cache=True, streaming=False):
+        """Reads the tabs of all parsers from the input once and passes them to each parser"""
+        check_input(filename)
+        tab_names, columns, num_readers = [], {}, {}
+        for parser in self.parsers:
+            for tab, name in parser.PARSE_TABS:
+                if tab not in tab_names:
+                    tab_names.append(tab)
+                num_readers[tab] = num_readers.get(tab, 0) + 1
+                # Columns read by any parser; None for all columns
+                if tab not in parser.PARSE_COLUMNS:
+                    columns[tab] = None
+                elif columns.get(tab, ()) is not None:
+                    columns[tab] = sorted(set(columns.get(tab, ())) | set(parser.PARSE_COLUMNS[tab]))
+        columns = dict((tab, tab_columns) for tab, tab_columns in columns.iteritems() if tab_columns is not None)
+
+        source = get_source(filename, use_cache, streaming, self.metrics)
+        tab_records = source.extract_records(tab_names, columns)
+        for tab, count in num_readers.iteritems():
+            if count > 1 and tab in tab_records:
+                # Records are read from the source once and iterated by each parser
+                tab_records[tab] = list(tab_records[tab])
+        for parser in self.parsers:
+            parser.parse_records(tab_records, filename)
+        source.close()
+
+    def run(self, in_filename, use_cache=True, streaming=False, metrics_filename=None, profile_filename=None):
+        with profiled(profile_filename):
+            self.parse(in_filename, use_cache=use_cache, streaming=streaming)
+            for name, parser_class, stage in REPORT_STAGES:
+                if name in self.reports:
+                    stage(self, self.get_parser(parser_class))
+            for manifest in self.manifests.itervalues():
+                manifest.save()
+
+        for parser in self.parsers:
+            parser.print_summary(in_filename)
+        print " " + self.metrics.get_summary()
+        if metrics_filename:
+            self.metrics.save(metrics_filename)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Requirements Report Pipeline")
+    parser.add_argument("in_filename", help="requirements xlsx file or directory of per-tab CSV/TSV files")
+    parser.add_argument("out_filename", nargs="?", help="coverage report file name")
+    parser.add_argument("--reports", default=",".join(REPORTS),
+                        help="comma separated reports to run, of %s (default: all)" % ", ".join(REPORTS))
+    parser.add_argument("--stream", action="store_true", help="stream xlsx rows instead of loading the workbook")
+    parser.add_argument("--no-cache", action="store_true", help="do not use the extracted worksheet cache")
+    parser.add_argument("--workers", type=int, default=tracewriter.TRACE_WORKERS,
+                        help="number of processes writing trace files (default: %(default)s)")
+    parser.add_argument("--trend-dir",
+                        help="coverage trend store to append the coverage report to (default: %s)" % TREND_DIR)
+    parser.add_argument("--no-trend", action="store_true", help="do not append to the coverage trend store")
+    parser.add_argument("--metrics", help="JSON file to write phase times, counts and peak memory to")
+    parser.add_argument("--profile", help="file to write cProfile stats of the run to")
+    args = parser.parse_args()
+
+    reports = [name.strip() for name in args.reports.split(",") if name.strip()]
+    for name in reports:
+        if name not in REPORTS:
+            parser.error("unknown report %s (choose from %s)" % (name, ", ".join(REPORTS)))
+    pipeline = ReqPipeline(reports, args.out_filename, args.workers, args.trend_dir, use_trend=not args.no_trend)
+    try:
+        pipeline.run(args.in_filename, use_cache=not args.no_cache, streaming=args.stream,
+                     metrics_filename=args.metrics, profile_filename=args.profile)
+    except InputError as ex:
+        print "ERROR: %s" % ex
+        sys.exit(1)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+"""Transitive reachability index over a requirement graph"""
+
+__author__ = 'Michael Meisinger'
+
+import array
+import binascii
+import bisect
+
+# A position set is stored as a bitset if that takes at most this many bits per member,
+# else as a sorted array of positions
+BITSET_MAX_BITS = 64
+
+
+def make_posset(positions):
+    """Returns a compact position set for a collection of positions: an int with the bits
+    of the positions set if dense enough, else a sorted array"""
+    if not positions:
+        return None
+    max_pos = max(positions)
+    if max_pos < BITSET_MAX_BITS * len(positions):
+        # Set the bits in a byte buffer, most significant byte first
+        buf = bytearray((max_pos >> 3) + 1)
+        for pos in positions:
+            buf[-1 - (pos >> 3)] |= 1 << (pos & 7)
+        return int(binascii.hexlify(buf), 16)
+    return array.array("i", sorted(positions))
+
+
+def posset_contains(posset, pos):
+    if not posset:
+        return False
+    if isinstance(posset, array.array):
+        i = bisect.bisect_left(posset, pos)
+        return i < len(posset) and posset[i] == pos
+    return bool((posset >> pos) & 1)
+
+
+def iter_posset(posset):
+    """Yields the positions of a position set in ascending order"""
+    if not posset:
+        return
+    if isinstance(posset, array.array):
+        for pos in posset:
+            yield pos
+        return
+    bits = posset
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class ReachIndex(object):
+    """All descendants and ancestors of each node of a ReqGraph, by level.
+
+    Nodes are numbered densely within their level. For each node and level, the positions
+    of the node's descendants (ancestors) of that level are kept as a bitset, or as a
+    sorted array where a bitset would be mostly zeros. Membership tests do not walk the
+    graph: a bit test for a bitset, a binary search in an array. The sets are extracted
+    directly. Building the index computes the full closure; build it only where trace
+    queries are answered.
+
+    child_ids(node) returns the node IDs of a node's children and defaults to the graph
+    links; e.g. milestones can be given their L4s as children."""
+
+    def __init__(self, graph, child_ids=None):
+        self.graph = graph
+        self.child_ids = child_ids or graph.child_ids
+        self.positions = array.array("i", [0] * len(graph.nodes))
+        self.level_nodes = {}
+        for node in graph.nodes:
+            level_nodes = self.level_nodes.setdefault(node.level, [])
+            self.positions[node.idx] = len(level_nodes)
+            level_nodes.append(node.idx)
+        # Per level of the reached nodes, a position set per node ID
+        self._down = dict((level, [None] * len(graph.nodes)) for level in self.level_nodes)
+        self._up = dict((level, [None] * len(graph.nodes)) for level in self.level_nodes)
+        self._build()
+
+    def is_descendant(self, node, other):
+        """Returns True if other is reachable from node via child links"""
+        return posset_contains(self._down[other.level][node.idx], self.positions[other.idx])
+
+    def is_ancestor(self, node, other):
+        """Returns True if node is reachable from other via child links"""
+        return posset_contains(self._up[other.level][node.idx], self.positions[other.idx])
+
+    def descendant_ids(self, node, level):
+        """Returns the node IDs of the descendants of node with the given level"""
+        if level not in self._down:
+            return []
+        level_nodes = self.level_nodes[level]
+        return [level_nodes[pos] for pos in iter_posset(self._down[level][node.idx])]
+
+    def ancestor_ids(self, node, level):
+        """Returns the node IDs of the ancestors of node with the given level"""
+        if level not in self._up:
+            return []
+        level_nodes = self.level_nodes[level]
+        return [level_nodes[pos] for pos in iter_posset(self._up[level][node.idx])]
+
+    def descendants(self, node, level):
+        return self._get_nodes(self.descendant_ids(node, level))
+
+    def ancestors(self, node, level):
+        return self._get_nodes(self.ancestor_ids(node, level))
+
+    def _get_nodes(self, node_ids):
+        nodes = [self.graph.nodes[idx] for idx in node_ids]
+        nodes.sort(key=lambda node: node.order)
+        return nodes
+
+    def _build(self):
+        nodes = self.graph.nodes
+
+        # Post-order of the child links: children come before their parents
+        order = []
+        children = [None] * len(nodes)
+        done = bytearray(len(nodes))
+        for start in nodes:
+            if done[start.idx]:
+                continue
+            stack = [(start.idx, False)]
+            while stack:
+                idx, children_done = stack.pop()
+                if done[idx]:
+                    continue
+                if children_done:
+                    done[idx] = 1
+                    order.append(idx)
+                    continue
+                stack.append((idx, True))
+                children[idx] = child_ids = self.child_ids(nodes[idx])
+                stack.extend((child_idx, False) for child_idx in child_ids if not done[child_idx])
+
+        self._reach(order, children, self._down)
+
+        # Parents come before their children in reverse order
+        parents = [None] * len(nodes)
+        for idx in order:
+            for child_idx in children[idx] or ():
+                if parents[child_idx] is None:
+                    parents[child_idx] = []
+                parents[child_idx].append(idx)
+        self._reach(reversed(order), parents, self._up)
+
+    def _reach(self, order, links, reach):
+        """Fills reach with the nodes reached via links, in an order in which linked nodes
+        are complete before the nodes linking to them"""
+        nodes = self.graph.nodes
+        positions = self.positions
+        level_reach = reach.items()
+        for idx in order:
+            linked_ids = links[idx]
+            if not linked_ids:
+                continue
+            reached = {}
+            for linked_idx in linked_ids:
+                linked_level = nodes[linked_idx].level
+                if linked_level in reached:
+                    reached[linked_level].add(positions[linked_idx])
+                else:
+                    reached[linked_level] = set([positions[linked_idx]])
+                for level, level_sets in level_reach:
+                    posset = level_sets[linked_idx]
+                    if posset:
+                        if level in reached:
+                            reached[level].update(iter_posset(posset))
+                        else:
+                            reached[level] = set(iter_posset(posset))
+            for level, level_positions in reached.iteritems():
+                reach[level][idx] = make_posset(level_positions)
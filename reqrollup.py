@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""Coverage status rollup over a requirement graph"""
+
+__author__ = 'Michael Meisinger'
+
+STATUS_VERIFIED = "VERIFIED"
+STATUS_R3 = "EXPECTED R3"
+STATUS_R4 = "EXPECTED R4"
+STATUS_OUT = "OUT"
+STATUS_PARTIAL = "PARTIAL"
+STATUS_OTHER = "OTHER"
+STATUS_MISSING = "MISSING %s"
+
+ADDRESSED = "ADDRESSED"
+NOT_ADDRESSED = "NOT ADDRESSED"
+
+# Leaf statuses that count as addressed
+ADDRESSED_STATUSES = (STATUS_VERIFIED, STATUS_R3)
+
+
+class RollupResult(object):
+    """Status of one requirement. For leaves only status and addressed are set.
+    For others, counts holds the number of children by child status, num_other the
+    children not verified, expected or out, and percent the share of addressed
+    children (None without children)."""
+
+    __slots__ = ("status", "addressed", "count", "counts", "num_other",
+                 "num_addressed", "num_not_addressed", "percent")
+
+    def __init__(self, status, addressed):
+        self.status = status
+        self.addressed = addressed
+        self.count = 0
+        self.counts = None
+        self.num_other = 0
+        self.num_addressed = 0
+        self.num_not_addressed = 0
+        self.percent = None
+
+
+class StatusRollup(object):
+    """Computes the status of every node of a ReqGraph in one bottom-up pass.
+
+    levels maps each level to be rolled up to the label of its child level (used
+    for the MISSING status); nodes of any other level are leaves, whose status is
+    given by leaf_status(node). child_ids(node) returns the node IDs of a node's
+    children and defaults to the graph links. Each node is evaluated exactly once,
+    no matter how many parents share it."""
+
+    def __init__(self, graph, levels, leaf_status, child_ids=None):
+        self.graph = graph
+        self.levels = levels
+        self.leaf_status = leaf_status
+        self.child_ids = child_ids or graph.child_ids
+        self.results = []
+
+    def compute(self, known=None):
+        """Computes the results of all nodes. known is an optional list of results by
+        node ID to reuse; only the nodes without a known result are evaluated."""
+        self.results = list(known) if known else [None] * len(self.graph.nodes)
+        for node in self.graph.nodes:
+            self._evaluate(node)
+        return self.results
+
+    def get(self, node):
+        return self.results[node.idx]
+
+    def _evaluate(self, start_node):
+        if self.results[start_node.idx] is not None:
+            return
+        # Iterative post-order walk: children are evaluated before their parents
+        nodes = self.graph.nodes
+        stack = [(start_node, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if self.results[node.idx] is not None:
+                continue
+            if node.level not in self.levels:
+                status = self.leaf_status(node)
+                self.results[node.idx] = RollupResult(status, ADDRESSED if status in ADDRESSED_STATUSES else NOT_ADDRESSED)
+                continue
+            child_ids = self.child_ids(node)
+            if children_done:
+                self.results[node.idx] = self._rollup(node, [self.results[idx] for idx in child_ids])
+                continue
+            stack.append((node, True))
+            stack.extend((nodes[idx], False) for idx in child_ids if self.results[idx] is None)
+
+    def _rollup(self, node, child_results):
+        counts = {}
+        num_addressed = num_not_addressed = 0
+        for child in child_results:
+            counts[child.status] = counts.get(child.status, 0) + 1
+            if child.addressed == ADDRESSED:
+                num_addressed += 1
+            elif child.addressed == NOT_ADDRESSED:
+                num_not_addressed += 1
+        count = len(child_results)
+        cnt_ver = counts.get(STATUS_VERIFIED, 0)
+        cnt_r3 = counts.get(STATUS_R3, 0)
+        cnt_r4 = counts.get(STATUS_R4, 0)
+        cnt_out = counts.get(STATUS_OUT, 0)
+        num_other = count - cnt_ver - cnt_r3 - cnt_r4 - cnt_out
+
+        if not count:
+            if " shall " in node.req_txt:
+                status = STATUS_MISSING % self.levels[node.level]
+            else:
+                status = ""
+        elif count == cnt_ver:
+            status = STATUS_VERIFIED
+        elif count == cnt_ver + cnt_r3:
+            status = STATUS_R3
+        elif count == cnt_ver + cnt_r3 + cnt_r4:
+            status = STATUS_R4
+        elif count == cnt_out + num_other:
+            status = STATUS_OUT
+        elif cnt_ver or cnt_r3:
+            status = STATUS_PARTIAL
+        else:
+            status = STATUS_OTHER
+
+        if num_addressed:
+            addressed = ADDRESSED
+        elif not status:
+            addressed = ""
+        else:
+            addressed = NOT_ADDRESSED
+
+        result = RollupResult(status, addressed)
+        result.count = count
+        result.counts = counts
+        result.num_other = num_other
+        result.num_addressed = num_addressed
+        result.num_not_addressed = num_not_addressed
+        result.percent = int(100 * (cnt_ver + cnt_r3) / count) if count else None
+        return result
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+
+"""Requirements Query Server.
+
+Parses and analyzes a requirements export once and answers queries from memory over
+HTTP/JSON. The input file is watched and reloaded in the background when it changes;
+queries are answered from the previous analysis until the reload completes.
+
+USAGE: python reqserver.py [--host <host>] [--port <port>] [--interval <sec>] [--stream] [--no-cache]
+       <in_filename>
+
+GET /status                          loaded file and counts
+GET /milestones/<ms_id>/trace        L2, L3 and L4 requirements traced to a milestone
+GET /requirements/<req_id>           status of a requirement or milestone
+GET /requirements/<req_id>/children  children with their status
+GET /requirements/<req_id>/up        requirements it is derived from and milestones it is delivered in
+GET /requirements/<req_id>/down      all requirements it is rolled up from
+"""
+
+__author__ = 'Michael Meisinger'
+
+import argparse
+import BaseHTTPServer
+import datetime
+import json
+import SocketServer
+import sys
+import threading
+import traceback
+import urllib
+import urlparse
+
+from reqanalysis import ReqAnalysis, REQ_FILE, TAB_L2, TAB_L3, TAB_L4, TAB_MS, LEVEL_LABELS
+from reqsource import get_source_stat, InputError
+
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8090
+# Seconds between checks of the input file for changes
+WATCH_INTERVAL = 2.0
+
+# Levels searched for a requirement ID, in order
+QUERY_LEVELS = [TAB_L2, TAB_L3, TAB_L4, TAB_MS]
+
+
+class ReqServer(object):
+    """Holds the current analysis of an input file and reloads it when the file changes.
+    The analysis is replaced as a whole, so each query sees one consistent analysis."""
+
+    def __init__(self, filename, use_cache=True, streaming=False, interval=None):
+        self.filename = filename
+        self.use_cache = use_cache
+        self.streaming = streaming
+        self.interval = interval or WATCH_INTERVAL
+        self.analysis = None
+        self.file_stat = None
+        self.loaded_at = None
+        self._stopped = threading.Event()
+
+    def load(self):
+        """Parses and analyzes the input file, replacing the current analysis"""
+        file_stat = self._get_file_stat()
+        ra = ReqAnalysis()
+        ra.parse(self.filename, use_cache=self.use_cache, streaming=self.streaming)
+        ra.analyze()
+        # Built before the analysis is swapped in, not by the first up/down query
+        ra.get_reach()
+        self.analysis, self.file_stat = ra, file_stat
+        self.loaded_at = datetime.datetime.now().isoformat()
+        print "Loaded %s: %s" % (self.filename, ra.metrics.get_summary())
+
+    def watch(self):
+        """Polls the input file and reloads it after changes, until stopped"""
+        while not self._stopped.wait(self.interval):
+            file_stat = None
+            try:
+                file_stat = self._get_file_stat()
+                if file_stat != self.file_stat:
+                    self.load()
+            except InputError as ex:
+                print "ERROR: Reload of %s failed, keeping previous analysis: %s" % (self.filename, ex)
+            except Exception:
+                print "ERROR: Reload of %s failed, keeping previous analysis" % self.filename
+                traceback.print_exc()
+            else:
+                continue
+            # Retried after the next change of the input
+            if file_stat is not None:
+                self.file_stat = file_stat
+
+    def start_watcher(self):
+        watcher = threading.Thread(target=self.watch, name="watcher")
+        watcher.daemon = True
+        watcher.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _get_file_stat(self):
+        return get_source_stat(self.filename)
+
+    # -------------------------------------------------------------------------
+
+    def get_status(self, ra):
+        return dict(filename=self.filename, loaded_at=self.loaded_at,
+                    counts=dict((LEVEL_LABELS[level], ra.graph.level_size(level)) for level in QUERY_LEVELS),
+                    num_links=ra.graph.num_links)
+
+    def get_ms_trace(self, ra, ms_id):
+        ms = ra.graph.get(TAB_MS, ms_id)
+        if not ms:
+            return None
+        result = self._get_req_info(ra, ms)
+        result["trace"] = [dict(level=LEVEL_LABELS[req.level], id=req.req_id, text=req.req_txt, desc=req.desc)
+                           for req in ra.get_ms_trace(ms)]
+        return result
+
+    def get_req_status(self, ra, req_id, level=None):
+        req = self._find_req(ra, req_id, level)
+        if not req:
+            return None
+        result = self._get_req_info(ra, req)
+        res = ra.rollup.get(req)
+        result.update(count=res.count, counts=res.counts, num_addressed=res.num_addressed,
+                      num_not_addressed=res.num_not_addressed, percent=res.percent,
+                      parents=[parent.req_id for parent in ra.graph.parents(req)])
+        return result
+
+    def get_req_children(self, ra, req_id, level=None):
+        req = self._find_req(ra, req_id, level)
+        if not req:
+            return None
+        result = self._get_req_info(ra, req)
+        result["children"] = [self._get_req_info(ra, child) for child in ra.get_children(req)]
+        return result
+
+    def get_req_trace(self, ra, req_id, direction, level=None):
+        req = self._find_req(ra, req_id, level)
+        if not req:
+            return None
+        result = self._get_req_info(ra, req)
+        trace = ra.trace_up(req) if direction == "up" else ra.trace_down(req)
+        result["trace"] = [self._get_req_info(ra, trace_req) for trace_req in trace]
+        return result
+
+    def _find_req(self, ra, req_id, level=None):
+        for query_level in QUERY_LEVELS:
+            if level in (None, query_level, LEVEL_LABELS[query_level]):
+                req = ra.graph.get(query_level, req_id)
+                if req:
+                    return req
+        return None
+
+    def _get_req_info(self, ra, req):
+        res = ra.rollup.get(req)
+        return dict(level=LEVEL_LABELS[req.level], id=req.req_id, text=req.req_txt,
+                    status=res.status, addressed=res.addressed)
+
+
+class ReqHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, req_server):
+        BaseHTTPServer.HTTPServer.__init__(self, address, ReqRequestHandler)
+        self.req_server = req_server
+
+
+class ReqRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        req_server = self.server.req_server
+        ra = req_server.analysis
+        url = urlparse.urlparse(self.path)
+        query = urlparse.parse_qs(url.query)
+        level = query.get("level", [None])[0]
+        parts = [urllib.unquote(part) for part in url.path.strip("/").split("/")]
+
+        if parts == ["status"]:
+            result = req_server.get_status(ra)
+        elif len(parts) == 3 and parts[0] == "milestones" and parts[2] == "trace":
+            result = req_server.get_ms_trace(ra, parts[1])
+        elif len(parts) == 2 and parts[0] == "requirements":
+            result = req_server.get_req_status(ra, parts[1], level)
+        elif len(parts) == 3 and parts[0] == "requirements" and parts[2] == "children":
+            result = req_server.get_req_children(ra, parts[1], level)
+        elif len(parts) == 3 and parts[0] == "requirements" and parts[2] in ("up", "down"):
+            result = req_server.get_req_trace(ra, parts[1], parts[2], level)
+        else:
+            return self._send_json(404, dict(error="Unknown query %s" % url.path))
+        if result is None:
+            return self._send_json(404, dict(error="Not found: %s" % parts[1]))
+        self._send_json(200, result)
+
+    def _send_json(self, code, result):
+        content = json.dumps(result)
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Requirements Query Server")
+    parser.add_argument("in_filename", nargs="?",
+                        help="requirements xlsx file or directory of per-tab CSV/TSV files (default: %s)" % REQ_FILE)
+    parser.add_argument("--host", default=SERVER_HOST, help="address to listen on (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=SERVER_PORT, help="port to listen on (default: %(default)s)")
+    parser.add_argument("--interval", type=float, default=WATCH_INTERVAL,
+                        help="seconds between checks of the input file for changes (default: %(default)s)")
+    parser.add_argument("--stream", action="store_true", help="stream xlsx rows instead of loading the workbook")
+    parser.add_argument("--no-cache", action="store_true", help="do not use the extracted worksheet cache")
+    args = parser.parse_args()
+
+    req_server = ReqServer(args.in_filename or REQ_FILE, use_cache=not args.no_cache, streaming=args.stream,
+                           interval=args.interval)
+    try:
+        req_server.load()
+    except InputError as ex:
+        print "ERROR: %s" % ex
+        sys.exit(1)
+    req_server.start_watcher()
+    httpd = ReqHTTPServer((args.host, args.port), req_server)
+    print "Serving queries on http://%s:%s/" % (args.host, args.port)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        req_server.stop()
+        httpd.server_close()
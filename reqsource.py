@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+
+"""Input sources of requirement records (Excel workbooks or directories of per-tab CSV files)
+and the base class of the parsers reading them"""
+
+__author__ = 'Michael Meisinger'
+
+import csv
+import os
+
+from reqmetrics import RunMetrics
+from xlscache import XLSCache
+from xlsparser import XLSParser, RowRecord, is_empty_row
+from xlsxstream import XLSXStreamReader
+
+# Delimiter of per-tab files by extension, in order of lookup
+CSV_DELIMITERS = [(".csv", ","), (".tsv", "\t")]
+
+UTF8_BOM = "\xef\xbb\xbf"
+
+
+class InputError(ValueError):
+    """An input file or one of its tabs does not exist. Callers handle it like any
+    other failed parse; the command line tools print it and exit."""
+    pass
+
+
+def get_source(path, use_cache=True, streaming=False, metrics=None):
+    """Returns the input source for a path: a directory of per-tab CSV/TSV files, or an
+    Excel workbook read via xlrd or, with streaming, from its XML"""
+    if os.path.isdir(path):
+        return CSVDirSource(path, metrics)
+    if streaming:
+        return XLSXStreamSource(path, metrics)
+    return XLSSource(path, use_cache, metrics)
+
+
+def get_source_stat(path):
+    """Returns (mtime, size) of an input file, or the latest mtime and total size of the
+    per-tab files in an input directory, to detect changes"""
+    if not os.path.isdir(path):
+        stat = os.stat(path)
+        return stat.st_mtime, stat.st_size
+    mtime, size = os.stat(path).st_mtime, 0
+    for fname in os.listdir(path):
+        stat = os.stat(os.path.join(path, fname))
+        mtime, size = max(mtime, stat.st_mtime), size + stat.st_size
+    return mtime, size
+
+
+class ReqParser(object):
+    """Base class of the parsers of requirement exports. A subclass lists the tabs it
+    reads with the name of their _parse_<name> row handler in PARSE_TABS, and the columns
+    the handlers read by tab in PARSE_COLUMNS. parse reads these tabs from an input source.
+    parse_records takes tabs read once for several parsers (see ReqPipeline)."""
+
+    PARSE_TABS = []
+    PARSE_COLUMNS = {}
+
+    def __init__(self, metrics=None):
+        self.metrics = metrics or RunMetrics()
+
+    def parse(self, filename, use_cache=True, streaming=False):
+        """Parses the requirements workbook, or a directory with a CSV/TSV file per tab.
+        With streaming, an xlsx file is read row by row from its XML instead of being
+        loaded into memory (no caching)."""
+        check_input(filename)
+        source = get_source(filename, use_cache, streaming, self.metrics)
+        self.parse_records(source.extract_records([tab for tab, name in self.PARSE_TABS], self.PARSE_COLUMNS),
+                           filename)
+        source.close()
+
+    def parse_records(self, tab_records, filename):
+        """Passes the row records of each tab to its _parse_<name> handler, then calls end_parse"""
+        self.in_filename = filename
+        for tab, name in self.PARSE_TABS:
+            tab_rows = tab_records.get(tab)
+            if tab_rows is None:
+                raise InputError("Tab %s not found in %s" % (tab, filename))
+            parse_func_name = "_parse_%s" % name
+            if hasattr(self, parse_func_name):
+                parse_func = getattr(self, parse_func_name)
+                with self.metrics.phase("parse:%s" % tab) as counters:
+                    self._tab = tab
+                    self._lnum = 0
+                    self._add_cnt = 0
+                    for row in tab_rows:
+                        # Sheet row of the record, for diagnostics
+                        self._row_num = getattr(row, "row_num", self._lnum + 2)
+                        res = parse_func(row)
+                        self._lnum += 1
+                        if res:
+                            self._add_cnt += 1
+                    counters.update(rows=self._lnum, used=self._add_cnt)
+        self.end_parse()
+
+    def end_parse(self):
+        """Called after all tabs are parsed, e.g. to build indexes"""
+        pass
+
+
+def check_input(filename):
+    if not os.path.exists(filename):
+        raise InputError("Requirements file %s does not exist" % filename)
+
+
+class XLSSource(object):
+    """Workbook read into memory and extracted via xlrd, with the worksheet cache"""
+
+    def __init__(self, filename, use_cache=True, metrics=None):
+        self.filename = filename
+        self.use_cache = use_cache
+        self.metrics = metrics or RunMetrics()
+
+    def extract_records(self, tab_names, columns=None):
+        """Returns a dict of tab name to an iterator of row records, as XLSParser.extract_records"""
+        with self.metrics.phase("read") as counters:
+            with open(self.filename, "rb") as f:
+                doc_str = f.read()
+            counters["bytes"] = len(doc_str)
+        with self.metrics.phase("extract", tabs=len(tab_names)):
+            cache = XLSCache() if self.use_cache else None
+            return XLSParser().extract_records(doc_str, tab_names, cache, columns)
+
+    def close(self):
+        pass
+
+
+class XLSXStreamSource(object):
+    """Workbook whose rows are read incrementally from the sheet XML (no caching)"""
+
+    def __init__(self, filename, metrics=None):
+        self.filename = filename
+        self.metrics = metrics or RunMetrics()
+        self.stream_reader = None
+
+    def extract_records(self, tab_names, columns=None):
+        with self.metrics.phase("extract", tabs=len(tab_names)):
+            self.stream_reader = XLSXStreamReader(self.filename)
+            return self.stream_reader.extract_records(tab_names, columns)
+
+    def close(self):
+        if self.stream_reader:
+            self.stream_reader.close()
+
+
+class CSVDirSource(object):
+    """Directory with one CSV or TSV file per tab, named after the tab (e.g. L2_CU.csv).
+    Files are utf-8 with a header row and are read row by row. Values are str, as from
+    the other sources."""
+
+    def __init__(self, path, metrics=None):
+        self.path = path
+        self.metrics = metrics or RunMetrics()
+        self._files = []
+
+    def get_tab_file(self, tab_name):
+        """Returns (filename, delimiter) of a tab's file, or None if there is none"""
+        for ext, delimiter in CSV_DELIMITERS:
+            filename = os.path.join(self.path, tab_name + ext)
+            if os.path.exists(filename):
+                return filename, delimiter
+        return None
+
+    def extract_records(self, tab_names, columns=None):
+        with self.metrics.phase("extract", tabs=len(tab_names)):
+            records = {}
+            for tab_name in tab_names:
+                tab_file = self.get_tab_file(tab_name)
+                if tab_file:
+                    records[tab_name] = self.iter_records(tab_file[0], tab_file[1],
+                                                         columns.get(tab_name) if columns else None)
+            return records
+
+    def iter_records(self, filename, delimiter, column_names=None):
+        """Yields a RowRecord per row after the header (first non-empty) row. If column_names
+        is given, records have only the columns with these header names. Row numbers
+        count records, as a spreadsheet shows them, not physical lines."""
+        f = open(filename, "rb")
+        self._files.append(f)
+        reader = enumerate(csv.reader(f, delimiter=delimiter), 1)
+        for row_num, header in reader:
+            if not is_empty_row(header):
+                break
+        else:
+            return
+        if header and header[0].startswith(UTF8_BOM):
+            header[0] = header[0][len(UTF8_BOM):]
+        colxs = [colx for colx, name in enumerate(header) if column_names is None or name in column_names]
+        header = [header[colx] for colx in colxs]
+        for row_num, line in reader:
+            yield RowRecord(row_num, zip(header, [line[colx] if colx < len(line) else "" for colx in colxs]))
+
+    def close(self):
+        for f in self._files:
+            f.close()
+        self._files = []
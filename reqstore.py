@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+
+"""SQLite store of analyzed requirements.
+
+Holds the requirements and milestones of an analysis run with their links, milestone
+traces, computed status and parse diagnostics. ReqAnalysis can be rebuilt from the store
+without parsing the export again.
+
+USAGE: python reqstore.py [--level <level>] [--status <status>] [--group <group>]
+       [--milestone <ms_id>] <db_filename>
+"""
+
+__author__ = 'Michael Meisinger'
+
+import argparse
+import datetime
+import json
+import os
+import sqlite3
+
+from reqgraph import ReqGraph
+from reqrollup import RollupResult
+
+STORE_VERSION = "2"
+
+# ReqNode attributes stored in the nodes table, with their column names
+NODE_COLUMNS = [
+    ("level", "level"),
+    ("req_id", "req_id"),
+    ("req_txt", "req_txt"),
+    ("desc", "description"),
+    ("item_type", "item_type"),
+    ("group", "grp"),
+    ("req_ms1", "req_ms1"),
+    ("req_ms2", "req_ms2"),
+    ("deliverable", "deliverable"),
+    ("num_parents", "num_parents"),
+    ("order", "ord"),
+]
+
+# RollupResult attributes stored in the nodes table. counts is stored as JSON.
+RESULT_COLUMNS = ["status", "addressed", "count", "counts", "num_other", "num_addressed",
+                  "num_not_addressed", "percent"]
+
+STORE_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE nodes (idx INTEGER PRIMARY KEY, %s, %s);
+CREATE TABLE links (parent INTEGER NOT NULL, child INTEGER NOT NULL);
+CREATE TABLE ms_reqs (ms INTEGER NOT NULL, level TEXT NOT NULL, idx INTEGER NOT NULL);
+CREATE TABLE diagnostics (type TEXT, tab TEXT, row INTEGER, source TEXT, target TEXT, occurrences INTEGER);
+CREATE INDEX nodes_req_id ON nodes (req_id);
+CREATE INDEX nodes_level ON nodes (level, ord);
+CREATE INDEX nodes_grp ON nodes (grp);
+CREATE INDEX nodes_req_ms1 ON nodes (req_ms1);
+CREATE INDEX nodes_req_ms2 ON nodes (req_ms2);
+CREATE INDEX nodes_status ON nodes (status);
+CREATE INDEX links_parent ON links (parent);
+CREATE INDEX links_child ON links (child);
+CREATE INDEX ms_reqs_ms ON ms_reqs (ms, level);
+""" % (", ".join(column for attr, column in NODE_COLUMNS), ", ".join(RESULT_COLUMNS))
+
+
+class ReqStore(object):
+    """A SQLite database file holding one analysis run"""
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def save(self, graph, results, ms_index, source=None, diag_rows=None):
+        """Saves a graph with the rollup results by node ID, the milestone index and the
+        rows of ReqDiagnostics.get_rows, replacing the previous contents. source is the
+        export the analysis was parsed from. The database is written to a temporary file
+        and moved into place, so readers always see a complete store."""
+        dirname = os.path.dirname(self.filename)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        tmp_filename = self.filename + ".tmp"
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        conn = self._connect(tmp_filename)
+        try:
+            conn.executescript(STORE_SCHEMA)
+            meta = dict(version=STORE_VERSION, source=source or "",
+                        saved_at=datetime.datetime.now().isoformat())
+            conn.executemany("INSERT INTO meta VALUES (?, ?)", meta.items())
+            conn.executemany("INSERT INTO nodes VALUES (%s)" % ", ".join(["?"] * (1 + len(NODE_COLUMNS) + len(RESULT_COLUMNS))),
+                             (self._get_node_row(node, results[node.idx]) for node in graph.nodes))
+            conn.executemany("INSERT INTO links VALUES (?, ?)",
+                             ((node.idx, child_idx) for node in graph.nodes for child_idx in graph.child_ids(node)))
+            conn.executemany("INSERT INTO ms_reqs VALUES (?, ?, ?)",
+                             ((ms_idx, level, idx) for ms_idx, ms_reqs in ms_index.iteritems()
+                              for level, idx_set in ms_reqs.iteritems() for idx in idx_set))
+            conn.executemany("INSERT INTO diagnostics VALUES (?, ?, ?, ?, ?, ?)", diag_rows or [])
+            conn.commit()
+        finally:
+            conn.close()
+        os.rename(tmp_filename, self.filename)
+
+    def load(self):
+        """Returns (graph, list of rollup results by node ID, milestone index) as saved"""
+        conn = self._connect(self.filename)
+        try:
+            version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if not version or version[0] != STORE_VERSION:
+                raise ValueError("Unsupported store version %s in %s" % (version and version[0], self.filename))
+
+            graph = ReqGraph()
+            results = []
+            attrs = [attr for attr, column in NODE_COLUMNS[2:]]
+            for row in conn.execute("SELECT * FROM nodes ORDER BY idx"):
+                node = graph.add_node(row[1], row[2], **dict(zip(attrs, row[3:3 + len(attrs)])))
+                assert node.idx == row[0]
+                results.append(self._get_result(row[3 + len(attrs):]))
+            nodes = graph.nodes
+            for parent_idx, child_idx in conn.execute("SELECT parent, child FROM links ORDER BY rowid"):
+                graph.add_link(nodes[parent_idx], nodes[child_idx])
+            ms_index = {}
+            for ms_idx, level, idx in conn.execute("SELECT ms, level, idx FROM ms_reqs"):
+                ms_index.setdefault(ms_idx, {}).setdefault(level, set()).add(idx)
+            return graph, results, ms_index
+        finally:
+            conn.close()
+
+    def get_diag_rows(self):
+        """Returns the saved diagnostics as rows of DIAG_HEADER values, in saved order"""
+        conn = self._connect(self.filename)
+        try:
+            return [list(row) for row in conn.execute("SELECT * FROM diagnostics ORDER BY rowid")]
+        finally:
+            conn.close()
+
+    def get_meta(self):
+        """Returns the dict of meta values saved with the store (version, source, saved_at)"""
+        conn = self._connect(self.filename)
+        try:
+            return dict(conn.execute("SELECT key, value FROM meta"))
+        finally:
+            conn.close()
+
+    def query(self, level=None, status=None, group=None, milestone=None):
+        """Returns a list of (level, req_id, req_txt, group, status, addressed) of the
+        requirements matching all given criteria, in level and sheet order. milestone
+        selects the requirements traced to the milestone with that ID."""
+        sql = "SELECT n.level, n.req_id, n.req_txt, n.grp, n.status, n.addressed FROM nodes n"
+        where, params = [], []
+        if milestone:
+            sql += " JOIN ms_reqs m ON m.idx = n.idx JOIN nodes ms ON ms.idx = m.ms"
+            where.append("ms.req_id = ?")
+            params.append(milestone)
+        for column, value in (("level", level), ("status", status), ("grp", group)):
+            if value is not None:
+                where.append("n.%s = ?" % column)
+                params.append(value)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY n.level, n.ord"
+        conn = self._connect(self.filename)
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def _connect(self, filename):
+        conn = sqlite3.connect(filename)
+        # Values other than text are stored as the utf-8 str they were parsed as
+        conn.text_factory = str
+        return conn
+
+    def _get_node_row(self, node, res):
+        row = [node.idx]
+        row.extend(getattr(node, attr) for attr, column in NODE_COLUMNS)
+        row.extend(getattr(res, attr) for attr in RESULT_COLUMNS)
+        counts_col = 1 + len(NODE_COLUMNS) + RESULT_COLUMNS.index("counts")
+        if row[counts_col] is not None:
+            row[counts_col] = json.dumps(row[counts_col])
+        return row
+
+    def _get_result(self, values):
+        res = RollupResult(values[0], values[1])
+        for attr, value in zip(RESULT_COLUMNS[2:], values[2:]):
+            setattr(res, attr, value)
+        if res.counts is not None:
+            res.counts = dict((str(status), count) for status, count in json.loads(res.counts).iteritems())
+        return res
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Requirements Store Query")
+    parser.add_argument("db_filename", help="store written by reqanalysis.py --save-db")
+    parser.add_argument("--level", help="level tab name, e.g. L3_CI")
+    parser.add_argument("--status", help="status, e.g. VERIFIED")
+    parser.add_argument("--group", help="L4 group, e.g. 1")
+    parser.add_argument("--milestone", help="milestone ID")
+    args = parser.parse_args()
+
+    for row in ReqStore(args.db_filename).query(args.level, args.status, args.group, args.milestone):
+        print "\t".join("" if value is None else str(value) for value in row)
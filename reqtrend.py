@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+
+"""Coverage trend store: the status of every requirement across analysis snapshots.
+
+USAGE: python reqtrend.py [--dir <dir>] snapshots
+       python reqtrend.py [--dir <dir>] counts [--level <level>]
+       python reqtrend.py [--dir <dir>] history [--level <level>] <req_id>
+
+counts prints the status counts of a level (default L2 and L3) per snapshot, history
+the status of one requirement or milestone per snapshot.
+"""
+
+__author__ = 'Michael Meisinger'
+
+import argparse
+import contextlib
+import datetime
+import json
+import mmap
+import os
+
+from reqrollup import ADDRESSED
+
+try:
+    import fcntl
+except ImportError:
+    # Unix only; elsewhere the store is used without locking
+    fcntl = None
+
+TREND_DIR = "output/trend"
+TREND_VERSION = 1
+
+INDEX_FILE = "trend.json"
+REQS_FILE = "reqs.tsv"
+STATUS_FILE = "status.bin"
+LOCK_FILE = "trend.lock"
+
+# Status code of requirements that do not exist in a snapshot
+CODE_ABSENT = 0
+# Bit set in the status code of addressed requirements
+CODE_ADDRESSED = 0x80
+
+
+def get_rollup_rows(graph, rollup):
+    """Returns (level, req_id, status, addressed) of every node, for TrendStore.append"""
+    rows = []
+    for node in graph.nodes:
+        res = rollup.get(node)
+        rows.append((node.level, node.req_id, res.status, res.addressed == ADDRESSED))
+    return rows
+
+
+class TrendStore(object):
+    """Append-only columnar store of requirement status per snapshot, in a directory.
+
+    Requirements are numbered in order of first appearance (reqs.tsv has the level and ID
+    of each). A snapshot is one byte per requirement number in the status file: the code
+    of the status (index into the statuses of trend.json, plus 1) with CODE_ADDRESSED set
+    if addressed, or CODE_ABSENT. trend.json also keeps the status counts per level of
+    each snapshot, so count series are read without touching the status column.
+
+    A snapshot appended again under the same label replaces the earlier one and keeps its
+    place in the series. The superseded bytes are dropped by rewriting the status file
+    once they outweigh the live ones. Writers hold an exclusive lock on trend.lock,
+    readers of the status file a shared one (where fcntl is available)."""
+
+    def __init__(self, trend_dir=None):
+        self.trend_dir = trend_dir or TREND_DIR
+        self.index = None
+        self.reqs = None
+        self._req_codes = None
+
+    def append(self, label, rows, source=None):
+        """Appends a snapshot given as (level, req_id, status, addressed) rows"""
+        if not os.path.exists(self.trend_dir):
+            os.makedirs(self.trend_dir)
+        with self._locked(exclusive=True):
+            self._append(label, rows, source)
+
+    def get_snapshots(self):
+        """Returns the snapshots in order of the first append of their label"""
+        self._load()
+        return self.index["snapshots"]
+
+    def get_level_counts(self, level):
+        """Returns (label, number of requirements, dict of status to count) per snapshot"""
+        return [(snapshot["label"], snapshot["num"].get(level, 0), snapshot["counts"].get(level, {}))
+                for snapshot in self.get_snapshots()]
+
+    def get_history(self, level, req_id):
+        """Returns (label, status, addressed) per snapshot for a requirement, with status
+        None where it did not exist. Returns None for an unknown requirement."""
+        if not os.path.exists(os.path.join(self.trend_dir, INDEX_FILE)):
+            return None
+        with self._locked(exclusive=False):
+            self._reset()
+            req_code = self._get_req_codes().get((level, req_id))
+            if req_code is None:
+                return None
+            statuses = self.index["statuses"]
+            history = []
+            with open(os.path.join(self.trend_dir, self._get_status_file()), "rb") as f:
+                column = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    for snapshot in self.index["snapshots"]:
+                        code = CODE_ABSENT
+                        if req_code < snapshot["num_reqs"]:
+                            code = ord(column[snapshot["offset"] + req_code])
+                        if code == CODE_ABSENT:
+                            history.append((snapshot["label"], None, False))
+                        else:
+                            history.append((snapshot["label"], statuses[(code & ~CODE_ADDRESSED) - 1],
+                                            bool(code & CODE_ADDRESSED)))
+                finally:
+                    column.close()
+        return history
+
+    def find_levels(self, req_id):
+        """Returns the levels with a requirement of this ID"""
+        return [level for level, code_req_id in self._get_req_codes() if code_req_id == req_id]
+
+    # -------------------------------------------------------------------------
+
+    def _append(self, label, rows, source):
+        # Another process may have appended since this store was loaded
+        self._reset()
+        req_code_map = self._get_req_codes()
+        index = self.index
+        status_codes = dict((status, code + 1) for code, status in enumerate(index["statuses"]))
+        new_reqs = []
+        req_codes = []
+        counts, num_reqs = {}, {}
+        for level, req_id, status, addressed in rows:
+            req_code = req_code_map.get((level, req_id))
+            if req_code is None:
+                req_code = req_code_map[(level, req_id)] = len(self.reqs)
+                self.reqs.append((level, req_id))
+                new_reqs.append((level, req_id))
+            status_code = status_codes.get(status)
+            if status_code is None:
+                index["statuses"].append(status)
+                status_code = status_codes[status] = len(index["statuses"])
+                if status_code >= CODE_ADDRESSED:
+                    raise ValueError("Too many distinct statuses in trend store")
+            req_codes.append((req_code, (status_code | CODE_ADDRESSED) if addressed else status_code))
+            level_counts = counts.setdefault(level, {})
+            level_counts[status] = level_counts.get(status, 0) + 1
+            if addressed:
+                level_counts[ADDRESSED] = level_counts.get(ADDRESSED, 0) + 1
+            num_reqs[level] = num_reqs.get(level, 0) + 1
+
+        # Requirements numbered past the snapshot's last one are absent from it
+        codes = bytearray(max(req_code for req_code, status_code in req_codes) + 1 if req_codes else 0)
+        for req_code, status_code in req_codes:
+            codes[req_code] = status_code
+
+        # Data past the sizes in the index is left from an interrupted append
+        with self._open_truncated(REQS_FILE, index["reqs_size"]) as f:
+            for level, req_id in new_reqs:
+                f.write("%s\t%s\n" % (level, req_id))
+            index["reqs_size"] = f.tell()
+        with self._open_truncated(self._get_status_file(), index["status_size"]) as f:
+            offset = f.tell()
+            f.write(codes)
+            index["status_size"] = f.tell()
+        index["num_reqs"] = len(self.reqs)
+
+        snapshot = dict(label=label, source=source, offset=offset, num_reqs=len(codes),
+                        counts=counts, num=num_reqs, created=datetime.datetime.now().isoformat())
+        snapshots = index["snapshots"]
+        for pos, old_snapshot in enumerate(snapshots):
+            if old_snapshot["label"] == label:
+                snapshots[pos] = snapshot
+                index["dead_size"] = index.get("dead_size", 0) + old_snapshot["num_reqs"]
+                break
+        else:
+            snapshots.append(snapshot)
+
+        old_status_file = None
+        if index.get("dead_size", 0) * 2 > index["status_size"]:
+            old_status_file = self._compact()
+        self._save_index()
+        if old_status_file:
+            os.remove(os.path.join(self.trend_dir, old_status_file))
+
+    def _compact(self):
+        """Copies the live snapshots to a new status file, updating their offsets in the
+        index. Returns the name of the old file, to be removed once the index is saved."""
+        index = self.index
+        old_status_file = self._get_status_file()
+        index["status_gen"] = index.get("status_gen", 0) + 1
+        status_file = self._get_status_file()
+        offset = 0
+        with open(os.path.join(self.trend_dir, old_status_file), "rb") as old_f:
+            with open(os.path.join(self.trend_dir, status_file), "wb") as f:
+                for snapshot in index["snapshots"]:
+                    old_f.seek(snapshot["offset"])
+                    f.write(old_f.read(snapshot["num_reqs"]))
+                    snapshot["offset"] = offset
+                    offset += snapshot["num_reqs"]
+        index["status_size"] = offset
+        index["dead_size"] = 0
+        return old_status_file
+
+    def _get_status_file(self):
+        """Returns the name of the current status file. A compaction writes a new one,
+        which becomes current when the index is saved."""
+        gen = self.index.get("status_gen", 0)
+        return STATUS_FILE if not gen else "status.%s.bin" % gen
+
+    def _load(self):
+        if self.index is not None:
+            return
+        path = os.path.join(self.trend_dir, INDEX_FILE)
+        if os.path.exists(path):
+            with open(path) as f:
+                self.index = json.load(f)
+            if self.index.get("version") != TREND_VERSION:
+                raise ValueError("Unsupported trend store version %s in %s" % (self.index.get("version"), path))
+        else:
+            self.index = dict(version=TREND_VERSION, statuses=[], num_reqs=0, reqs_size=0, status_size=0,
+                              dead_size=0, status_gen=0, snapshots=[])
+
+    def _reset(self):
+        self.index = None
+        self.reqs = None
+        self._req_codes = None
+
+    def _get_req_codes(self):
+        """Returns the dict of (level, req_id) to requirement number, read on first use"""
+        self._load()
+        if self._req_codes is not None:
+            return self._req_codes
+        self.reqs = []
+        if self.index["num_reqs"]:
+            with open(os.path.join(self.trend_dir, REQS_FILE), "rb") as f:
+                for line in f:
+                    if len(self.reqs) == self.index["num_reqs"]:
+                        break
+                    level, req_id = line.rstrip("\n").split("\t", 1)
+                    self.reqs.append((level, req_id))
+        self._req_codes = dict((req, code) for code, req in enumerate(self.reqs))
+        return self._req_codes
+
+    @contextlib.contextmanager
+    def _locked(self, exclusive):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.trend_dir, LOCK_FILE), "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _open_truncated(self, fname, size):
+        path = os.path.join(self.trend_dir, fname)
+        f = open(path, "r+b" if os.path.exists(path) else "w+b")
+        f.truncate(size)
+        f.seek(size)
+        return f
+
+    def _save_index(self):
+        path = os.path.join(self.trend_dir, INDEX_FILE)
+        tmp_path = "%s.%s.tmp" % (path, os.getpid())
+        with open(tmp_path, "w") as f:
+            json.dump(self.index, f, sort_keys=True)
+        os.rename(tmp_path, path)
+
+
+if __name__ == '__main__':
+    from reqanalysis import TAB_L2, TAB_L3, LEVEL_LABELS, TRACE_LEVELS
+
+    def get_level(value):
+        for level in TRACE_LEVELS:
+            if value in (level, LEVEL_LABELS[level]):
+                return level
+        parser.error("unknown level %s" % value)
+
+    parser = argparse.ArgumentParser(description="Requirements Coverage Trend")
+    parser.add_argument("--dir", help="trend store directory (default: %s)" % TREND_DIR)
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("snapshots", help="list the snapshots")
+    counts_parser = subparsers.add_parser("counts", help="status counts of a level per snapshot")
+    counts_parser.add_argument("--level", action="append", help="level (L2, L3, L4, Milestone); repeatable")
+    history_parser = subparsers.add_parser("history", help="status of a requirement per snapshot")
+    history_parser.add_argument("--level", help="level of the requirement if the ID is ambiguous")
+    history_parser.add_argument("req_id", help="requirement or milestone ID")
+    args = parser.parse_args()
+
+    trend = TrendStore(args.dir)
+    if args.command == "snapshots":
+        for snapshot in trend.get_snapshots():
+            print "%s\t%s\t%s" % (snapshot["label"], snapshot["created"], snapshot["source"] or "")
+    elif args.command == "counts":
+        for level in [get_level(value) for value in args.level] if args.level else [TAB_L2, TAB_L3]:
+            level_counts = trend.get_level_counts(level)
+            statuses = sorted(set(status for label, num, counts in level_counts for status in counts
+                                  if status != ADDRESSED)) + [ADDRESSED]
+            print "%s\tNum\t%s" % (LEVEL_LABELS[level], "\t".join(status or "(none)" for status in statuses))
+            for label, num, counts in level_counts:
+                print "%s\t%s\t%s" % (label, num, "\t".join(str(counts.get(status, 0)) for status in statuses))
+    elif args.command == "history":
+        levels = [get_level(args.level)] if args.level else \
+            [level for level in TRACE_LEVELS if level in trend.find_levels(args.req_id)]
+        history = trend.get_history(levels[0], args.req_id) if levels else None
+        if history is None:
+            print "ERROR: Requirement %s not found in trend store" % args.req_id
+        else:
+            for label, status, addressed in history:
+                print "%s\t%s\t%s" % (label, "-" if status is None else status or "(none)",
+                                      ADDRESSED if addressed else "")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+"""Tests of incremental re-analysis against a full rollup"""
+
+__author__ = 'Michael Meisinger'
+
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+
+from reqanalysis import ReqAnalysis, PARSE_TABS, PARSE_COLUMNS, TAB_L3, TAB_L4
+from reqbench import generate_workbook
+from reqdelta import ReqState
+from reqrollup import RollupResult
+from xlsparser import XLSParser
+
+
+class ReqDeltaTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp(prefix="reqtest")
+        filename = os.path.join(cls.tmp_dir, "synth.xlsx")
+        generate_workbook(filename, num_l4=300, num_ms=10, seed=3)
+        with open(filename, "rb") as f:
+            records = XLSParser().extract_records(f.read(), [tab for tab, name in PARSE_TABS], None, PARSE_COLUMNS)
+        cls.records = dict((tab, list(rows)) for tab, rows in records.iteritems())
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir, ignore_errors=True)
+
+    def analyze(self, records, prev_state=None):
+        ra = ReqAnalysis()
+        ra.parse_records(copy.deepcopy(records), "synth.xlsx")
+        ra.analyze(prev_state)
+        return ra
+
+    def get_state(self, ra):
+        """Returns the state of an analysis after a save and load"""
+        path = os.path.join(self.tmp_dir, "state")
+        ReqState.from_analysis(ra.graph, ra.rollup).save(path)
+        return ReqState.load(path)
+
+    def get_changed_records(self):
+        records = copy.deepcopy(self.records)
+        l4_rows = records[TAB_L4]
+        for row in l4_rows[:10]:
+            row["Group"] = "5" if row["Group"] != "5" else "0"
+        l4_rows[30]["L3 Link"] = l4_rows[31]["L3 Link"]
+        new_row = dict(l4_rows[40])
+        new_row["ID"] = "L4-CI-NEW"
+        del l4_rows[20]
+        l4_rows.append(new_row)
+        l3_rows = records[TAB_L3]
+        l3_rows[5]["L2_CU"] = l3_rows[6]["L2_CU"]
+        return records
+
+    def assertSameResults(self, ra, expected_ra):
+        self.assertEqual(len(ra.graph.nodes), len(expected_ra.graph.nodes))
+        for expected_node in expected_ra.graph.nodes:
+            node = ra.graph.get(expected_node.level, expected_node.req_id)
+            self.assertIsNotNone(node)
+            res, expected_res = ra.rollup.get(node), expected_ra.rollup.get(expected_node)
+            for attr in RollupResult.__slots__:
+                self.assertEqual(getattr(res, attr), getattr(expected_res, attr),
+                                 "%s of %s" % (attr, expected_node))
+
+    def test_unchanged(self):
+        prev_state = self.get_state(self.analyze(self.records))
+        ra = self.analyze(self.records, prev_state)
+        self.assertEqual(len(ra.delta.changes), 0)
+        self.assertEqual(len(ra.delta.dirty), 0)
+        self.assertSameResults(ra, self.analyze(self.records))
+
+    def test_changes_match_full_rollup(self):
+        prev_state = self.get_state(self.analyze(self.records))
+        records = self.get_changed_records()
+        ra = self.analyze(records, prev_state)
+        self.assertTrue(ra.delta.changes)
+        self.assertTrue(0 < len(ra.delta.dirty) < len(ra.graph.nodes))
+        self.assertSameResults(ra, self.analyze(records))
+
+
+if __name__ == '__main__':
+    unittest.main()
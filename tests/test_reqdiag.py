@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+"""Tests of the collected parse diagnostics and where they are written to"""
+
+__author__ = 'Michael Meisinger'
+
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+
+from reportwriter import XlsxReportWriter
+from reqanalysis import ReqAnalysis, PARSE_COLUMNS, TAB_L2, TAB_L3, TAB_L4, TAB_MS
+from reqbatch import ReqBatch
+from reqdiag import ReqDiagnostics, DIAG_HEADER, DIAG_DUPLICATE_ID, DIAG_MISSING_TARGET, DIAG_DUPLICATE_LINK
+from reqpipeline import ReqPipeline
+from xlsxstream import XLSXStreamReader
+
+L3_STATEMENT = "The system shall do something"
+
+# Rows of each tab after its header; every tab starts with two blank rows
+TAB_ROWS = {
+    TAB_L2: [
+        {"ID": "L2-CU-RQ-1"},
+        {"ID": "L2-CU-RQ-2"},
+        {"ID": "L2-CU-RQ-1"},
+        {"ID": "L2-CU-RQ-1"},
+    ],
+    TAB_L3: [
+        {"ID": "L3-CI-RQ-1", "Requirement Statement": L3_STATEMENT, "L2_CU": "1\n1"},
+        {"ID": "L3-CI-RQ-2", "Requirement Statement": L3_STATEMENT, "L2_CU": "9\n9"},
+        {"ID": "L3-CI-RQ-3", "Requirement Statement": L3_STATEMENT, "L2_CU": "2"},
+        {"ID": "L3-CI-RQ-3", "Requirement Statement": L3_STATEMENT, "L2_CU": "2"},
+    ],
+    TAB_L4: [
+        {"ID": "L4-CI-RQ-1", "Item Class": "Approved Req", "L3 Link": "1", "Group": "1"},
+        {"ID": "L4-CI-RQ-2", "Item Class": "Approved Req", "L3 Link": "3\n7", "Group": "2"},
+    ],
+    TAB_MS: [
+        {"ID": "MS-1", "Milestone Name": "First"},
+    ],
+}
+
+# Header on row 3, first record on row 4
+EXPECTED_ROWS = [
+    [DIAG_DUPLICATE_ID, TAB_L2, 6, "L2-CU-RQ-1", "", 2],
+    [DIAG_DUPLICATE_LINK, TAB_L3, 4, "L3-CI-RQ-1", "L2-CU-RQ-1", 1],
+    [DIAG_MISSING_TARGET, TAB_L3, 5, "L3-CI-RQ-2", "L2-CU-RQ-9", 2],
+    [DIAG_DUPLICATE_ID, TAB_L3, 7, "L3-CI-RQ-3", "", 1],
+    [DIAG_DUPLICATE_LINK, TAB_L3, 7, "L3-CI-RQ-3", "L2-CU-RQ-2", 1],
+    [DIAG_MISSING_TARGET, TAB_L4, 5, "L4-CI-RQ-2", "L3-CI-RQ-7", 1],
+]
+
+
+def get_sheet_rows(tab):
+    """Returns the rows of a tab, starting with two blank rows and the header"""
+    header = PARSE_COLUMNS[tab]
+    return [[], [], header] + [[row.get(name, "") for name in header] for row in TAB_ROWS[tab]]
+
+
+def read_diag_sheet(filename):
+    """Returns the rows of the Diagnostics sheet of a report, with numbers as int"""
+    reader = XLSXStreamReader(filename)
+    try:
+        records = list(reader.extract_records(["Diagnostics"])["Diagnostics"])
+    finally:
+        reader.close()
+    rows = []
+    for record in records:
+        row = [record[name] for name in DIAG_HEADER]
+        row[2], row[5] = int(float(row[2])), int(float(row[5]))
+        rows.append(row)
+    return rows
+
+
+class ReqDiagnosticsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="reqtest")
+        # Reports and manifests are written relative to the working directory
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp_dir)
+
+        self.csv_dir = os.path.join(self.tmp_dir, "export")
+        os.mkdir(self.csv_dir)
+        for tab in TAB_ROWS:
+            with open(os.path.join(self.csv_dir, tab + ".csv"), "wb") as f:
+                csv.writer(f).writerows(get_sheet_rows(tab))
+
+        self.xlsx_filename = os.path.join(self.tmp_dir, "export.xlsx")
+        writer = XlsxReportWriter(self.xlsx_filename)
+        for tab in TAB_ROWS:
+            sheet_rows = get_sheet_rows(tab)
+            ws = writer.add_sheet(tab, sheet_rows[0])
+            for row in sheet_rows[1:]:
+                ws.append(row)
+        writer.close()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def parse(self, filename, streaming=False):
+        ra = ReqAnalysis()
+        ra.parse(filename, use_cache=False, streaming=streaming)
+        return ra
+
+    def test_collected_once_with_occurrences(self):
+        for filename, streaming in ((self.csv_dir, False), (self.xlsx_filename, False), (self.xlsx_filename, True)):
+            ra = self.parse(filename, streaming)
+            self.assertEqual(ra.diagnostics.get_rows(), EXPECTED_ROWS, "%s streaming=%s" % (filename, streaming))
+            self.assertEqual(len(ra.diagnostics), len(EXPECTED_ROWS))
+            self.assertEqual(ra.diagnostics.get_counts(),
+                             {DIAG_DUPLICATE_ID: 2, DIAG_DUPLICATE_LINK: 2, DIAG_MISSING_TARGET: 2})
+
+    def test_add_rows(self):
+        diagnostics = ReqDiagnostics()
+        diagnostics.add_rows(EXPECTED_ROWS)
+        self.assertEqual(diagnostics.get_rows(), EXPECTED_ROWS)
+        # Rows added again count as further occurrences of the first ones
+        diagnostics.add_rows([[DIAG_MISSING_TARGET, TAB_L4, 9, "L4-CI-RQ-2", "L3-CI-RQ-7", 3]])
+        self.assertEqual(diagnostics.get_rows()[-1], [DIAG_MISSING_TARGET, TAB_L4, 5, "L4-CI-RQ-2", "L3-CI-RQ-7", 4])
+
+    def test_store_round_trip(self):
+        ra = self.parse(self.csv_dir)
+        ra.analyze()
+        db_filename = os.path.join(self.tmp_dir, "req.db")
+        ra.save_store(db_filename, source=ra.in_filename)
+        loaded_ra = ReqAnalysis()
+        loaded_ra.load_store(db_filename)
+        self.assertEqual(loaded_ra.diagnostics.get_rows(), EXPECTED_ROWS)
+
+    def test_save_csv(self):
+        ra = self.parse(self.csv_dir)
+        csv_filename = os.path.join(self.tmp_dir, "diag", "diagnostics.csv")
+        ra.diagnostics.save_csv(csv_filename)
+        with open(csv_filename, "rb") as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows, [DIAG_HEADER] + [map(str, row) for row in EXPECTED_ROWS])
+
+    def test_report_sheet(self):
+        ra = self.parse(self.xlsx_filename)
+        ra.analyze()
+        out_filename = os.path.join(self.tmp_dir, "report.xlsx")
+        ra.dump_analysis(out_filename)
+        self.assertEqual(read_diag_sheet(out_filename), EXPECTED_ROWS)
+
+    def test_pipeline_report_sheet(self):
+        out_filename = os.path.join(self.tmp_dir, "report.xlsx")
+        pipeline = ReqPipeline(["coverage"], out_filename, use_trend=False)
+        pipeline.run(self.csv_dir, use_cache=False)
+        diagnostics = ReqDiagnostics()
+        diagnostics.add_rows(read_diag_sheet(out_filename))
+        self.assertEqual(diagnostics.get_rows(), EXPECTED_ROWS)
+
+    def test_batch_report_sheet(self):
+        out_dir = os.path.join(self.tmp_dir, "batch")
+        batch = ReqBatch(out_dir, workers=1, use_cache=False, use_trend=False)
+        batch.analyze_all([self.xlsx_filename])
+        self.assertIsNone(batch.results[0][2])
+        diagnostics = ReqDiagnostics()
+        diagnostics.add_rows(read_diag_sheet(batch._get_report_filename(self.xlsx_filename)))
+        self.assertEqual(diagnostics.get_rows(), EXPECTED_ROWS)
+
+
+if __name__ == '__main__':
+    unittest.main()
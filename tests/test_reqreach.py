@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+"""Tests of the reachability index against a graph walk"""
+
+__author__ = 'Michael Meisinger'
+
+import random
+import unittest
+
+from reqgraph import ReqGraph
+import reqreach
+from reqreach import ReachIndex, make_posset, posset_contains, iter_posset
+
+LEVELS = ["L2", "L3", "L4"]
+
+
+def make_graph(seed, num_nodes=200):
+    """Returns a graph of L2, L3 and L4 nodes with random links to the next levels"""
+    rnd = random.Random(seed)
+    graph = ReqGraph()
+    for i in range(num_nodes):
+        graph.add_node(LEVELS[i % 3], "R%d" % i, order=num_nodes - i)
+    for node in graph.nodes:
+        level_pos = LEVELS.index(node.level)
+        for i in range(rnd.randint(0, 4)):
+            child = rnd.choice(graph.nodes)
+            if LEVELS.index(child.level) > level_pos:
+                graph.add_link(node, child)
+    return graph
+
+
+def walk(graph, node, get_ids):
+    reached, stack = set(), [node.idx]
+    while stack:
+        for idx in get_ids(graph.nodes[stack.pop()]):
+            if idx not in reached:
+                reached.add(idx)
+                stack.append(idx)
+    return reached
+
+
+class ReachIndexTest(unittest.TestCase):
+
+    def check_graph(self, graph):
+        reach = ReachIndex(graph)
+        for node in graph.nodes:
+            down = walk(graph, node, graph.child_ids)
+            up = walk(graph, node, graph.parent_ids)
+            for level in LEVELS:
+                level_down = set(idx for idx in down if graph.nodes[idx].level == level)
+                level_up = set(idx for idx in up if graph.nodes[idx].level == level)
+                self.assertEqual(set(reach.descendant_ids(node, level)), level_down)
+                self.assertEqual(set(reach.ancestor_ids(node, level)), level_up)
+                self.assertEqual([other.order for other in reach.descendants(node, level)],
+                                 sorted(graph.nodes[idx].order for idx in level_down))
+            for other in graph.nodes:
+                self.assertEqual(reach.is_descendant(node, other), other.idx in down)
+                self.assertEqual(reach.is_ancestor(node, other), other.idx in up)
+
+    def test_matches_walk(self):
+        for seed in range(3):
+            self.check_graph(make_graph(seed))
+
+    def test_array_and_bitset_sets(self):
+        max_bits = reqreach.BITSET_MAX_BITS
+        try:
+            for bits in (0, 1 << 20):
+                reqreach.BITSET_MAX_BITS = bits
+                self.check_graph(make_graph(7))
+        finally:
+            reqreach.BITSET_MAX_BITS = max_bits
+
+    def test_posset(self):
+        self.assertIsNone(make_posset([]))
+        self.assertFalse(posset_contains(None, 0))
+        for positions in ([0, 5, 3], [1000, 2, 70000]):
+            posset = make_posset(positions)
+            self.assertEqual(list(iter_posset(posset)), sorted(positions))
+            for pos in range(0, 70002, 97) + positions:
+                self.assertEqual(posset_contains(posset, pos), pos in positions)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+"""Tests of appending to and querying the coverage trend store"""
+
+__author__ = 'Michael Meisinger'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from reqrollup import ADDRESSED
+from reqtrend import TrendStore, STATUS_FILE, REQS_FILE
+
+
+def get_rows(statuses):
+    """Returns trend rows of L4s R0.. with the given statuses, every other one addressed"""
+    return [("L4", "R%d" % i, status, i % 2 == 0) for i, status in enumerate(statuses)]
+
+
+class TrendStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.trend_dir = tempfile.mkdtemp(prefix="reqtest")
+
+    def tearDown(self):
+        shutil.rmtree(self.trend_dir, ignore_errors=True)
+
+    def test_counts_and_history(self):
+        trend = TrendStore(self.trend_dir)
+        trend.append("a.xlsx", get_rows(["OUT", "VERIFIED"]))
+        trend.append("b.xlsx", get_rows(["VERIFIED", "VERIFIED", "OUT"]))
+
+        trend = TrendStore(self.trend_dir)
+        self.assertEqual(trend.get_level_counts("L4"), [
+            ("a.xlsx", 2, {"OUT": 1, "VERIFIED": 1, ADDRESSED: 1}),
+            ("b.xlsx", 3, {"OUT": 1, "VERIFIED": 2, ADDRESSED: 2}),
+        ])
+        self.assertEqual(trend.get_level_counts("L3"), [("a.xlsx", 0, {}), ("b.xlsx", 0, {})])
+        self.assertEqual(trend.get_history("L4", "R0"), [("a.xlsx", "OUT", True), ("b.xlsx", "VERIFIED", True)])
+        self.assertEqual(trend.get_history("L4", "R2"), [("a.xlsx", None, False), ("b.xlsx", "OUT", True)])
+        self.assertIsNone(trend.get_history("L4", "R9"))
+        self.assertEqual(trend.find_levels("R1"), ["L4"])
+
+    def test_reappend_keeps_position(self):
+        trend = TrendStore(self.trend_dir)
+        for label in ("a", "b", "c"):
+            trend.append(label, get_rows(["OUT"]))
+        trend.append("a", get_rows(["VERIFIED"]))
+
+        trend = TrendStore(self.trend_dir)
+        self.assertEqual([snapshot["label"] for snapshot in trend.get_snapshots()], ["a", "b", "c"])
+        self.assertEqual(trend.get_history("L4", "R0"),
+                         [("a", "VERIFIED", True), ("b", "OUT", True), ("c", "OUT", True)])
+
+    def test_reappend_compacts(self):
+        trend = TrendStore(self.trend_dir)
+        statuses = ["OUT"] * 100
+        trend.append("a", get_rows(statuses))
+        for i in range(10):
+            statuses[i] = "VERIFIED"
+            trend.append("b", get_rows(statuses))
+
+        status_files = [fname for fname in os.listdir(self.trend_dir) if fname.startswith("status")]
+        self.assertEqual(len(status_files), 1)
+        self.assertTrue(os.path.getsize(os.path.join(self.trend_dir, status_files[0])) <= 2 * 2 * 100)
+        trend = TrendStore(self.trend_dir)
+        self.assertEqual(len(trend.get_snapshots()), 2)
+        self.assertEqual(trend.get_history("L4", "R9"), [("a", "OUT", False), ("b", "VERIFIED", False)])
+        self.assertEqual(trend.get_level_counts("L4")[1][2], {"OUT": 90, "VERIFIED": 10, ADDRESSED: 50})
+
+    def test_interrupted_append_is_dropped(self):
+        trend = TrendStore(self.trend_dir)
+        trend.append("a", get_rows(["OUT", "OUT"]))
+        # Data of an append that did not get to save the index
+        with open(os.path.join(self.trend_dir, STATUS_FILE), "ab") as f:
+            f.write("\x7f" * 10)
+        with open(os.path.join(self.trend_dir, REQS_FILE), "ab") as f:
+            f.write("L4\tBROKEN\n")
+
+        trend = TrendStore(self.trend_dir)
+        trend.append("b", get_rows(["VERIFIED", "OUT", "OUT"]))
+        trend = TrendStore(self.trend_dir)
+        self.assertIsNone(trend.get_history("L4", "BROKEN"))
+        self.assertEqual(trend.get_history("L4", "R2"), [("a", None, False), ("b", "OUT", True)])
+        self.assertEqual(trend.get_history("L4", "R0"), [("a", "OUT", True), ("b", "VERIFIED", True)])
+
+
+if __name__ == '__main__':
+    unittest.main()
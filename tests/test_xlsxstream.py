@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+"""Tests of the streaming xlsx reader against the xlrd records"""
+
+__author__ = 'Michael Meisinger'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from reportwriter import XlsxReportWriter
+from reqbench import generate_workbook
+from xlsparser import XLSParser
+from xlsxstream import XLSXStreamReader
+import reqanalysis
+import reqgen
+
+
+def get_tab_names(parser_class):
+    return [tab for tab, name in parser_class.PARSE_TABS]
+
+
+def read_all(records):
+    return dict((tab, list(rows)) for tab, rows in records.iteritems())
+
+
+class XLSXStreamTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp(prefix="reqtest")
+        cls.filename = os.path.join(cls.tmp_dir, "synth.xlsx")
+        generate_workbook(cls.filename, num_l4=200, num_ms=10, seed=2)
+        with open(cls.filename, "rb") as f:
+            cls.doc_str = f.read()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir, ignore_errors=True)
+
+    def stream_records(self, filename, tab_names, columns=None):
+        reader = XLSXStreamReader(filename)
+        try:
+            return read_all(reader.extract_records(tab_names, columns))
+        finally:
+            reader.close()
+
+    def test_records_match_xlrd(self):
+        tab_names = get_tab_names(reqanalysis.ReqAnalysis) + get_tab_names(reqgen.ReqAnalysis)
+        expected = read_all(XLSParser().extract_records(self.doc_str, tab_names))
+        self.assertEqual(sorted(expected), sorted(tab_names))
+        self.assertEqual(self.stream_records(self.filename, tab_names), expected)
+
+    def test_projected_records_match_xlrd(self):
+        for parser_class in (reqanalysis.ReqAnalysis, reqgen.ReqAnalysis):
+            tab_names, columns = get_tab_names(parser_class), parser_class.PARSE_COLUMNS
+            expected = read_all(XLSParser().extract_records(self.doc_str, tab_names, None, columns))
+            for tab, rows in expected.iteritems():
+                self.assertTrue(rows)
+                if tab in columns:
+                    self.assertEqual(set(rows[0]), set(columns[tab]))
+            self.assertEqual(self.stream_records(self.filename, tab_names, columns), expected)
+
+    def test_header_after_blank_rows(self):
+        tab_names, columns = get_tab_names(reqanalysis.ReqAnalysis), reqanalysis.PARSE_COLUMNS
+        filename = os.path.join(self.tmp_dir, "blank_rows.xlsx")
+        writer = XlsxReportWriter(filename)
+        for tab, rows in XLSParser().extract_worksheets(self.doc_str, tab_names).iteritems():
+            # The header is appended as the third row
+            ws = writer.add_sheet(tab, [])
+            ws.append([])
+            for row in rows:
+                ws.append(row)
+        writer.close()
+
+        expected = read_all(XLSParser().extract_records(self.doc_str, tab_names, None, columns))
+        self.assertEqual(self.stream_records(filename, tab_names, columns), expected)
+        with open(filename, "rb") as f:
+            self.assertEqual(read_all(XLSParser().extract_records(f.read(), tab_names, None, columns)), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
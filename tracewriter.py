@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+"""Rendering and writing of HTML trace pages"""
+
+__author__ = 'Michael Meisinger'
+
+import multiprocessing
+import os
+
+from htmltable import render_table
+from outmanifest import write_if_changed
+
+# Default number of processes writing trace pages. Sending the rows to worker processes
+# costs about as much as rendering them, so more only pay off where writes are slow
+# (e.g. a network filesystem).
+TRACE_WORKERS = 1
+
+# Encoding of the written pages. Cells given as str must be in this encoding.
+PAGE_ENCODING = "utf-8"
+
+
+def write_page(page):
+    """Renders a page given as (filename, title, header, rows, previous content hash) and
+    writes it in one go if its content changed. Returns (filename, content hash, written)"""
+    filename, title, header, rows, prev_hash = page
+    content = render_table(title, header, rows)
+    content_hash, written = write_if_changed(filename, content, prev_hash)
+    return filename, content_hash, written
+
+
+def write_pages(pages, out_dir, workers=None, manifest=None):
+    """Writes the given pages (filename, title, header, rows) into out_dir, using a pool
+    of worker processes if workers > 1. The written files are the same as when writing
+    serially. Pages with unchanged content are not rewritten. With an OutputManifest,
+    pages are recorded in it and pages of a previous run not generated again are removed.
+    Returns the number of pages written."""
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    pages = [page + (manifest.get_hash(page[0]) if manifest else None,) for page in pages]
+    workers = min(workers or TRACE_WORKERS, len(pages))
+    if workers <= 1:
+        results = map(write_page, pages)
+    else:
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = pool.map(write_page, pages, chunksize=max(1, len(pages) / (4 * workers)))
+        finally:
+            pool.close()
+            pool.join()
+    if manifest:
+        for filename, content_hash, written in results:
+            manifest.update(filename, content_hash, written)
+        manifest.remove_stale(out_dir)
+    return sum(1 for filename, content_hash, written in results if written)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+"""Persistent cache of extracted XLS worksheets"""
+
+__author__ = 'Michael Meisinger'
+
+import errno
+import hashlib
+import marshal
+import os
+
+from xlsparser import PARSER_VERSION
+
+CACHE_DIR = "output/cache"
+CACHE_MAX_SIZE = 500 * 1024 * 1024
+CACHE_EXT = ".marshal"
+
+
+class XLSCache(object):
+    """Stores the extracted sheets of a workbook on disk, keyed by the hash of the
+    file content, the parser version and the selected sheets and columns. Least recently used
+    entries are evicted once the cache exceeds max_size bytes. Several processes may share
+    the cache; an entry removed by another one is a cache miss."""
+
+    def __init__(self, cache_dir=None, max_size=None):
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.max_size = CACHE_MAX_SIZE if max_size is None else max_size
+
+    def get_key(self, file_content, sheet_names=None, columns=None):
+        key = hashlib.sha1()
+        key.update("%s:%s:" % (PARSER_VERSION, marshal.version))
+        key.update(",".join(sorted(sheet_names)) if sheet_names is not None else "*")
+        key.update(":")
+        if columns:
+            key.update(";".join("%s=%s" % (sheet_name, ",".join(sorted(columns[sheet_name])))
+                                for sheet_name in sorted(columns)))
+            key.update(":")
+        key.update(file_content)
+        return key.hexdigest()
+
+    def get(self, key):
+        path = self._entry_path(key)
+        try:
+            with open(path, "rb") as f:
+                sheets = marshal.load(f)
+            # Mark as recently used for eviction
+            os.utime(path, None)
+        except (IOError, OSError) as ex:
+            if ex.errno != errno.ENOENT:
+                raise
+            return None
+        except (EOFError, ValueError, TypeError):
+            print "WARNING: Removing corrupt cache entry %s" % path
+            _remove_entry(path)
+            return None
+        return sheets
+
+    def put(self, key, sheets):
+        try:
+            os.makedirs(self.cache_dir)
+        except OSError as ex:
+            if ex.errno != errno.EEXIST:
+                raise
+        path = self._entry_path(key)
+        tmp_path = "%s.%s.tmp" % (path, os.getpid())
+        with open(tmp_path, "wb") as f:
+            marshal.dump(sheets, f)
+        os.rename(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total_size = 0
+        for fname in os.listdir(self.cache_dir):
+            if not fname.endswith(CACHE_EXT):
+                continue
+            path = os.path.join(self.cache_dir, fname)
+            try:
+                stat = os.stat(path)
+            except OSError as ex:
+                if ex.errno != errno.ENOENT:
+                    raise
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+        for mtime, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            _remove_entry(path)
+            total_size -= size
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key + CACHE_EXT)
+
+
+def _remove_entry(path):
+    """Removes a cache file unless another process already did"""
+    try:
+        os.remove(path)
+    except OSError as ex:
+        if ex.errno != errno.ENOENT:
+            raise
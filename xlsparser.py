@@ -5,12 +5,38 @@
 __author__ = 'Michael Meisinger'
 
 import csv
+import itertools
 import StringIO
 import xlrd
 
+# Bump when the extracted values change, to invalidate cached worksheets
+PARSER_VERSION = "3"
+
+
+def is_empty_row(line):
+    """Returns True if a row of formatted values has no value. The header row of a sheet
+    is its first non-empty row."""
+    for value in line:
+        if value != "":
+            return False
+    return True
+
+
+class RowRecord(dict):
+    """Row record keyed by the header names, with the 1-based number of its sheet row"""
+    __slots__ = ("row_num",)
+
+    def __init__(self, row_num, items):
+        dict.__init__(self, items)
+        self.row_num = row_num
+
 
 class XLSParser(object):
-    """Class that transforms an XLS file into a dict of csv files (str)"""
+    """Class that transforms an XLS file into a dict of csv files (str) or row records (dict)"""
+
+    def __init__(self):
+        # Formatted dates by (value, datemode)
+        self._isodates = {}
 
     def extract_csvs(self, file_content):
         sheets = self.extract_worksheets(file_content)
@@ -22,18 +48,75 @@ class XLSParser(object):
             csv_docs[sheet_name] = csv_doc
         return csv_docs
 
-    def extract_worksheets(self, file_content):
-        book = xlrd.open_workbook(file_contents=file_content)
+    def extract_records(self, file_content, sheet_names=None, cache=None, columns=None):
+        """Returns a dict of sheet name to an iterator of row records, each a dict
+        keyed by the sheet's header row. Values are str, as after a csv round trip.
+        See extract_worksheets for columns."""
+        sheets = self.extract_worksheets(file_content, sheet_names, cache, columns)
+        records = {}
+        for sheet_name, sheet in sheets.iteritems():
+            records[sheet_name] = self.iter_records(sheet)
+        return records
+
+    def iter_records(self, sheet):
+        """Yields a RowRecord per row after the header (first non-empty) row"""
+        header_rowx = 0
+        while header_rowx < len(sheet) and is_empty_row(sheet[header_rowx]):
+            header_rowx += 1
+        if header_rowx == len(sheet):
+            return
+        header = self.stringize(sheet[header_rowx])
+        for rowx, line in enumerate(itertools.islice(sheet, header_rowx + 1, None), header_rowx + 2):
+            yield RowRecord(rowx, zip(header, self.stringize(line)))
+
+    def extract_worksheets(self, file_content, sheet_names=None, cache=None, columns=None):
+        """Returns a dict of sheet name to list of formatted rows. If sheet_names is
+        given, the workbook is opened on demand and only the named sheets are loaded,
+        formatted and unloaded again; all other sheets are skipped.
+        columns is an optional dict of sheet name to the header names of the columns
+        to extract. Only these cells are formatted, and the rows of the sheet (including
+        the header row) contain only these columns, in sheet order. Empty rows before
+        the header row are kept as empty lists, so rows keep their sheet position.
+        If a cache (XLSCache) is given, previously extracted sheets for the same
+        content are returned from it without opening the workbook."""
+        if cache:
+            cache_key = cache.get_key(file_content, sheet_names, columns)
+            sheets = cache.get(cache_key)
+            if sheets is None:
+                sheets = self._load_worksheets(file_content, sheet_names, columns)
+                cache.put(cache_key, sheets)
+            return sheets
+        return self._load_worksheets(file_content, sheet_names, columns)
+
+    def _load_worksheets(self, file_content, sheet_names, columns):
+        on_demand = sheet_names is not None
+        book = xlrd.open_workbook(file_contents=file_content, on_demand=on_demand)
         sheets = {}
-        formatter = lambda(t,v): self.format_excelval(book,t,v,False)
 
         for sheet_name in book.sheet_names():
+            if on_demand and sheet_name not in sheet_names:
+                # xlrd loads all sheets of an xlsx regardless of on_demand
+                book.unload_sheet(sheet_name)
+                continue
             raw_sheet = book.sheet_by_name(sheet_name)
             data = []
+            colxs = None
             for row in range(raw_sheet.nrows):
                 (types, values) = (raw_sheet.row_types(row), raw_sheet.row_values(row))
-                data.append(map(formatter, zip(types, values)))
+                if colxs is None:
+                    # Header row, always formatted in full to find the columns
+                    line = self.format_row(book, types, values)
+                    if is_empty_row(line):
+                        data.append([])
+                        continue
+                    colxs = self.get_column_indexes(line, columns.get(sheet_name) if columns else None)
+                    data.append([line[colx] for colx in colxs])
+                else:
+                    data.append(self.format_row(book, types, values, colxs))
             sheets[sheet_name] = data
+            if on_demand:
+                book.unload_sheet(sheet_name)
+        book.release_resources()
         return sheets
 
     def dumps_csv(self, sheet):
@@ -55,6 +138,30 @@ class XLSParser(object):
             cvs_lines.append(csv_doc)
         return cvs_lines
 
+    def get_column_indexes(self, header, column_names=None):
+        """Returns the indexes of the header values in column_names, or of all header values"""
+        if column_names is None:
+            return range(len(header))
+        column_names = set(column_names)
+        return [colx for colx, name in enumerate(self.stringize(header)) if name in column_names]
+
+    def format_row(self, book, types, values, colxs=None):
+        """Returns the formatted values of a row, or of the cells at colxs only"""
+        if colxs is None:
+            colxs = range(len(values))
+        line = []
+        for colx in colxs:
+            if colx >= len(values):
+                line.append("")
+                continue
+            cell_type = types[colx]
+            # Text and empty cells are kept as they are
+            if cell_type == xlrd.XL_CELL_TEXT or cell_type == xlrd.XL_CELL_EMPTY:
+                line.append(values[colx])
+            else:
+                line.append(self.format_excelval(book, cell_type, values[colx], False))
+        return line
+
     def tupledate_to_isodate(self, tupledate):
         (y,m,d, hh,mm,ss) = tupledate
         nonzero = lambda n: n!=0
@@ -66,13 +173,27 @@ class XLSParser(object):
         if   type == 2: # TEXT
             if value == int(value): value = int(value)
         elif type == 3: # NUMBER
-            datetuple = xlrd.xldate_as_tuple(value, book.datemode)
-            value = datetuple if wanttupledate else self.tupledate_to_isodate(datetuple)
+            if wanttupledate:
+                value = xlrd.xldate_as_tuple(value, book.datemode)
+            else:
+                value = self.get_isodate(value, book.datemode)
         elif type == 5: # ERROR
             value = xlrd.error_text_from_code[value]
         return value
 
+    def get_isodate(self, value, datemode):
+        """Returns the ISO date of an Excel date value, memoized as few distinct dates recur"""
+        isodate = self._isodates.get((value, datemode))
+        if isodate is None:
+            isodate = self.tupledate_to_isodate(xlrd.xldate_as_tuple(value, datemode))
+            self._isodates[(value, datemode)] = isodate
+        return isodate
+
     def utf8ize(self, l):
         return [unicode(s).encode("utf-8") if hasattr(s,'encode') else s for s in l]
 
+    def stringize(self, l):
+        # Same str values csv.writer would produce: utf-8 text, repr for floats
+        return [repr(s) if type(s) is float else unicode(s).encode("utf-8") for s in l]
+
 
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+
+"""Streaming reader for XLSX files"""
+
+__author__ = 'Michael Meisinger'
+
+import posixpath
+import re
+import zipfile
+import xlrd
+from xlrd.formatting import is_date_format_string
+from xml.etree import cElementTree as ET
+
+from xlsparser import XLSParser, RowRecord, is_empty_row
+
+NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+XML_SPACE_ATTR = "{http://www.w3.org/XML/1998/namespace}space"
+
+TAG_ROW = NS_MAIN + "row"
+TAG_SHEETDATA = NS_MAIN + "sheetData"
+TAG_V = NS_MAIN + "v"
+TAG_IS = NS_MAIN + "is"
+TAG_T = NS_MAIN + "t"
+TAG_R = NS_MAIN + "r"
+TAG_SI = NS_MAIN + "si"
+
+# Built-in number formats that xlrd treats as dates
+DATE_FORMAT_IDS = range(14, 23) + range(45, 48)
+
+_escaped_char_sub = re.compile(r"_x([0-9A-Fa-f]{4})_").sub
+
+
+class XLSXStreamReader(object):
+    """Iterates the rows of XLSX worksheets directly from the sheet XML, holding only
+    the current row in memory. Shared strings and styles are read once on open.
+    Values are formatted the same way as XLSParser.extract_worksheets does.
+
+    The datemode and verbosity attributes make this usable as the book argument
+    of XLSParser.format_excelval and the xlrd format helpers."""
+
+    verbosity = 0
+
+    def __init__(self, filename):
+        self.zf = zipfile.ZipFile(filename)
+        self._parser = XLSParser()
+        self._members = dict((name.lower(), name) for name in self.zf.namelist())
+        self.datemode = 0
+        self._sheet_parts = {}
+        self._sheet_names = []
+        self._xf_is_date = []
+        self._shared_strings = []
+        self._col_index = {}
+        self._read_workbook()
+        self._read_styles()
+        self._read_shared_strings()
+
+    def close(self):
+        self.zf.close()
+
+    def sheet_names(self):
+        return list(self._sheet_names)
+
+    def extract_records(self, sheet_names=None, columns=None):
+        """Returns a dict of sheet name to an iterator of row records, like
+        XLSParser.extract_records, with the same columns option. Rows are read when
+        the iterator is consumed."""
+        records = {}
+        for sheet_name in self._sheet_names:
+            if sheet_names is None or sheet_name in sheet_names:
+                records[sheet_name] = self.iter_records(sheet_name, columns.get(sheet_name) if columns else None)
+        return records
+
+    def iter_records(self, sheet_name, column_names=None):
+        """Yields a RowRecord per row after the header (first non-empty) row. If column_names
+        is given, records have only the columns with these header names."""
+        stringize = self._parser.stringize
+        header = colxs = None
+        for row_num, line in enumerate(self.iter_rows(sheet_name, column_names), 1):
+            if header is None:
+                if is_empty_row(line):
+                    continue
+                colxs = self._parser.get_column_indexes(line, column_names)
+                header = stringize([line[colx] for colx in colxs])
+                continue
+            yield RowRecord(row_num, zip(header, stringize([line[colx] if colx < len(line) else "" for colx in colxs])))
+
+    def iter_rows(self, sheet_name, column_names=None):
+        """Yields the formatted values of each row in the sheet as a list. Empty rows
+        before the last non-empty row are yielded as empty lists. If column_names is
+        given, only the cells of the columns with these names in the header (first
+        non-empty) row are formatted in the rows after it; all other cells are left empty."""
+        stream = self.zf.open(self._sheet_parts[sheet_name])
+        colxs = None
+        sheet_data = None
+        rowx = -1
+        next_rowx = 0
+        for event, elem in ET.iterparse(stream, events=("start", "end")):
+            if event == "start":
+                if elem.tag == TAG_SHEETDATA:
+                    sheet_data = elem
+                continue
+            if elem.tag != TAG_ROW:
+                continue
+            row_number = elem.get("r")
+            rowx = int(row_number) - 1 if row_number else rowx + 1
+            line = self._read_row(elem, colxs)
+            sheet_data.clear()
+            if not line:
+                continue
+            if column_names is not None and not is_empty_row(line):
+                colxs = set(self._parser.get_column_indexes(line, column_names))
+                column_names = None
+            while next_rowx < rowx:
+                yield []
+                next_rowx += 1
+            next_rowx = rowx + 1
+            yield line
+        stream.close()
+
+    # -------------------------------------------------------------------------
+
+    def _read_row(self, row_elem, colxs=None):
+        line = []
+        colx = -1
+        skipped = False
+        format_excelval = self._parser.format_excelval
+        for cell_elem in row_elem:
+            cell_name = cell_elem.get("r")
+            colx = self._get_colx(cell_name) if cell_name else colx + 1
+            if colxs is not None and colx not in colxs:
+                skipped = skipped or len(cell_elem) > 0
+                continue
+            cell_type = cell_elem.get("t", "n")
+            value = None
+            if cell_type == "inlineStr":
+                for child in cell_elem:
+                    if child.tag == TAG_IS:
+                        value = self._get_text(child)
+                    elif child.tag == TAG_V:
+                        value = child.text
+                value = value or u""
+            else:
+                tvalue = None
+                for child in cell_elem:
+                    if child.tag == TAG_V:
+                        tvalue = child.text if cell_type != "str" else self._cooked_text(child)
+                if cell_type == "n":
+                    if tvalue:
+                        xf_index = int(cell_elem.get("s", "0"))
+                        is_date = xf_index < len(self._xf_is_date) and self._xf_is_date[xf_index]
+                        value = format_excelval(self, xlrd.XL_CELL_DATE if is_date else xlrd.XL_CELL_NUMBER,
+                                                float(tvalue), False)
+                elif cell_type == "s":
+                    if tvalue:
+                        value = self._shared_strings[int(tvalue)]
+                elif cell_type == "str":
+                    value = tvalue or u""
+                elif cell_type == "b":
+                    value = 1 if tvalue in ("1", "true") else 0
+                elif cell_type == "e":
+                    value = tvalue or "#N/A"
+            if value is None:
+                continue
+            if colx >= len(line):
+                line.extend([""] * (colx + 1 - len(line)))
+            line[colx] = value
+        if skipped and not line:
+            # A row with values in skipped columns only is still a row
+            line.append("")
+        return line
+
+    def _get_colx(self, cell_name):
+        letters = cell_name.rstrip("0123456789").lstrip("$").replace("$", "")
+        colx = self._col_index.get(letters)
+        if colx is None:
+            colx = 0
+            for c in letters:
+                colx = colx * 26 + ord(c.upper()) - ord("A") + 1
+            colx -= 1
+            self._col_index[letters] = colx
+        return colx
+
+    def _cooked_text(self, elem):
+        text = elem.text
+        if text is None:
+            return u""
+        if elem.get(XML_SPACE_ATTR) != "preserve":
+            text = text.strip("\t\n\r ")
+        if "_x" in text:
+            text = _escaped_char_sub(lambda m: unichr(int(m.group(1), 16)), text)
+        return unicode(text)
+
+    def _get_text(self, elem):
+        """Returns the text of a shared string or inline string element"""
+        accum = []
+        for child in elem:
+            if child.tag == TAG_T:
+                accum.append(self._cooked_text(child))
+            elif child.tag == TAG_R:
+                for tnode in child:
+                    if tnode.tag == TAG_T:
+                        accum.append(self._cooked_text(tnode))
+        return u"".join(accum)
+
+    def _open_member(self, name):
+        member = self._members.get(name.lower())
+        return self.zf.open(member) if member else None
+
+    def _read_workbook(self):
+        targets = {}
+        stream = self._open_member("xl/_rels/workbook.xml.rels")
+        for elem in ET.parse(stream).getroot().findall(NS_PKG_REL + "Relationship"):
+            target = elem.get("Target")
+            if target.startswith("/"):
+                target = target[1:]
+            else:
+                target = posixpath.normpath(posixpath.join("xl", target))
+            targets[elem.get("Id")] = target
+        stream.close()
+
+        stream = self._open_member("xl/workbook.xml")
+        root = ET.parse(stream).getroot()
+        stream.close()
+        workbook_pr = root.find(NS_MAIN + "workbookPr")
+        if workbook_pr is not None and workbook_pr.get("date1904") in ("1", "true"):
+            self.datemode = 1
+        for elem in root.iter(NS_MAIN + "sheet"):
+            sheet_name = unicode(elem.get("name"))
+            self._sheet_names.append(sheet_name)
+            self._sheet_parts[sheet_name] = self._members[targets[elem.get(NS_REL + "id")].lower()]
+
+    def _read_styles(self):
+        stream = self._open_member("xl/styles.xml")
+        if not stream:
+            return
+        root = ET.parse(stream).getroot()
+        stream.close()
+        fmt_is_date = dict.fromkeys(DATE_FORMAT_IDS, True)
+        num_fmts = root.find(NS_MAIN + "numFmts")
+        if num_fmts is not None:
+            for elem in num_fmts:
+                fmt_is_date[int(elem.get("numFmtId"))] = is_date_format_string(self, unicode(elem.get("formatCode")))
+        cell_xfs = root.find(NS_MAIN + "cellXfs")
+        if cell_xfs is not None:
+            self._xf_is_date = [bool(fmt_is_date.get(int(elem.get("numFmtId", "0")))) for elem in cell_xfs]
+
+    def _read_shared_strings(self):
+        stream = self._open_member("xl/sharedStrings.xml")
+        if not stream:
+            return
+        for event, elem in ET.iterparse(stream):
+            if elem.tag == TAG_SI:
+                self._shared_strings.append(self._get_text(elem))
+                elem.clear()
+        stream.close()